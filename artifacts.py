@@ -0,0 +1,74 @@
+"""
+Debug images from the extractors (crops, masks, contours, joined letters).
+
+Recording is off by default: extractors get NO_RECORDER, check `enabled`
+and skip building and encoding the debug images entirely. For a request
+that may need a look later, MemoryRecorder keeps the images in memory and
+writes them out only if the request gets flagged (save); FileRecorder
+writes them to a directory straight away.
+"""
+import os
+
+import cv2
+
+MODES = ("off", "memory", "files")
+
+
+class ArtifactRecorder:
+    """Recorder that drops everything; the base for the other recorders."""
+
+    enabled = False
+
+    def record(self, name, image):
+        pass
+
+
+class MemoryRecorder(ArtifactRecorder):
+    """Keeps copies of the images of one request, by name, until save() or the recorder is dropped."""
+
+    enabled = True
+
+    def __init__(self):
+        self.images = {}
+
+    def record(self, name, image):
+        # Copy: extractors keep drawing on some of the images after recording them
+        self.images[name] = image.copy()
+
+    def save(self, directory, prefix=""):
+        """Write the recorded images as PNG files; returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for name, image in self.images.items():
+            path = os.path.join(directory, f"{prefix}{name}.png")
+            cv2.imwrite(path, image)
+            paths.append(path)
+        return paths
+
+
+class FileRecorder(ArtifactRecorder):
+    """Writes every image to directory/{prefix}{name}.png as soon as it is recorded."""
+
+    enabled = True
+
+    def __init__(self, directory=".", prefix=""):
+        self.directory = directory
+        self.prefix = prefix
+
+    def record(self, name, image):
+        os.makedirs(self.directory, exist_ok=True)
+        cv2.imwrite(os.path.join(self.directory, f"{self.prefix}{name}.png"), image)
+
+
+NO_RECORDER = ArtifactRecorder()
+
+
+def make_recorder(mode, directory=".", prefix=""):
+    """Recorder for one request in the given mode (see MODES)."""
+    if mode == "off":
+        return NO_RECORDER
+    if mode == "memory":
+        return MemoryRecorder()
+    if mode == "files":
+        return FileRecorder(directory, prefix)
+    raise ValueError(f"Unknown artifacts mode: {mode!r}")
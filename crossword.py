@@ -1,39 +1,104 @@
+import argparse
+import os
+import time
+
 import cv2
 import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFont
+
+from artifacts import NO_RECORDER, FileRecorder
+from glyphs import load_classifier
+from layout import (EMPTY_COLOR, EMPTY_TOLERANCE, FILLED_COLOR, FILLED_TOLERANCE, color_mask, crop,
+                    detect_layout)
+from letters import load_image, ocr_glyphs
+
+
+def cell_glyph(mask_filled, box):
+    """Glyph of a revealed cell (white on black): its non-yellow pixels, cropped to the letter."""
+    x, y, w, h = box
+    # Skip the cell border and rounded corners
+    dx, dy = w // 7, h // 7
+    glyph = cv2.bitwise_not(mask_filled[y + dy:y + h - dy, x + dx:x + w - dx])
+    points = cv2.findNonZero(glyph)
+    if points is None:
+        return None
+    gx, gy, gw, gh = cv2.boundingRect(points)
+    return glyph[gy:gy + gh, gx:gx + gw]
+
+
+def read_cell_letters(glyphs):
+    """
+    Lowercase letter of every revealed-cell glyph, or None where it could
+    not be read. The glyph classifier reads what it is sure about (see
+    glyphs); the rest go to Tesseract in a single joined call and stay None
+    if that line is misread, so a screenshot costs at most one Tesseract run
+    here.
+    """
+    classifier = load_classifier()
+    letters = classifier.classify(glyphs) if classifier is not None else [None] * len(glyphs)
+    unsure = [i for i, letter in enumerate(letters) if letter is None]
+    for i, letter in zip(unsure, ocr_glyphs([glyphs[i] for i in unsure], per_glyph=False)):
+        letters[i] = letter
+    return [letter.lower() if letter is not None else None for letter in letters]
+
+
+GRID_ENGINES = ("contours", "projection")
 
+# Width of the downsampled crop the projection engine works on: a third of a
+# 1080 px screenshot, which still keeps a pixel of every gap between cells
+WORK_WIDTH = 360
 
-def extract_crossword_grid(image_path):
-    img = cv2.imread(image_path)
-    h, w, _ = img.shape
 
-    # Crop top area (crossword zone)
-    y1, y2 = int(h * 0.19), int(h * 0.60)
-    x1, x2 = int(0), int(w)
-    cropped = img[y1:y2, x1:x2]
+def box_letters(mask_filled, boxes):
+    """Letter (or None) of every revealed cell box, see cell_glyph and read_cell_letters."""
+    glyphs = [cell_glyph(mask_filled, box) for box in boxes]
+    readable = [i for i, glyph in enumerate(glyphs) if glyph is not None]
+    letters = [None] * len(boxes)
+    for i, letter in zip(readable, read_cell_letters([glyphs[i] for i in readable])):
+        letters[i] = letter
+    return letters
 
-    cv2.imwrite('ccropped.png', cropped)
+
+def extract_crossword_grid(image, read_letters=True, recorder=NO_RECORDER, engine="contours", layout=None):
+    """
+    Grid matrix of the screenshot: 0 for no cell, 1 for an empty cell and the
+    lowercase letter of a revealed (yellow) cell, which the solver takes as
+    fixed. A revealed cell whose letter can't be read stays 1, as does every
+    cell with read_letters=False.
+    image is a screenshot path or an already decoded BGR ndarray; debug
+    images go to recorder (see artifacts), nothing is recorded by default.
+    engine is "contours" (cell contours on the full-resolution crop) or
+    "projection" (mask projections on a downsampled crop, much faster).
+    layout is the screenshot's layout.Layout, detected here if not given.
+    """
+    if engine not in GRID_ENGINES:
+        raise ValueError(f"Unknown grid engine: {engine!r}")
+    img = load_image(image)
+    if layout is None:
+        layout = detect_layout(img)
+
+    # Crop the crossword zone
+    cropped = crop(img, layout.grid)
+
+    if recorder.enabled:
+        recorder.record('ccropped', cropped)
+    if engine == "projection":
+        return _grid_by_projection(cropped, read_letters, recorder)
+    return _grid_by_contours(cropped, read_letters, recorder)
+
+
+def _grid_by_contours(cropped, read_letters, recorder):
     # Convert to HSV for color filtering (blue squares)
     # hsv = cv2.cvtColor(cropped, cv2.COLOR_BGR2HSV)
 
     # empty
-    target_color = np.array([98, 107, 20])  # BGR equivalent of RGB 20, 107, 98
-    tolerance = 10
-    lower_bound = np.maximum(target_color - tolerance, 0)
-    upper_bound = np.minimum(target_color + tolerance, 255)
-    mask_empty = cv2.inRange(cropped, lower_bound, upper_bound)
+    mask_empty = color_mask(cropped, EMPTY_COLOR, EMPTY_TOLERANCE)
 
     #filled
-    target_color = np.array([31, 231, 251])  # BGR equivalent of RGB 251, 231, 31
-    tolerance = 30
-    lower_bound = np.maximum(target_color - tolerance, 0)
-    upper_bound = np.minimum(target_color + tolerance, 255)
-    mask_filled = cv2.inRange(cropped, lower_bound, upper_bound)
+    mask_filled = color_mask(cropped, FILLED_COLOR, FILLED_TOLERANCE)
 
     mask = cv2.bitwise_or(mask_empty, mask_filled)
 
-    masked = cv2.bitwise_and(cropped, cropped, mask=mask)
-    cv2.imwrite('cmasked.png', masked)
     # Find contours
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     boxes = []
@@ -42,8 +107,11 @@ def extract_crossword_grid(image_path):
         # Filter out small noise
         if w > 10 and h > 10:
             boxes.append((x, y, w, h))
-    contered = cv2.drawContours(masked, contours, -1, (0,255,0), 3)
-    cv2.imwrite('ccontered.png', contered)
+    if recorder.enabled:
+        masked = cv2.bitwise_and(cropped, cropped, mask=mask)
+        recorder.record('cmasked', masked)
+        contered = cv2.drawContours(masked, contours, -1, (0,255,0), 3)
+        recorder.record('ccontered', contered)
     # Sort by Y, then X
     boxes = sorted(boxes, key=lambda b: (b[1]//50, b[0]))
 
@@ -51,21 +119,30 @@ def extract_crossword_grid(image_path):
     if not boxes:
         return []
 
+    # Revealed cells get their letter, the rest stay 1
+    values = [1] * len(boxes)
+    if read_letters:
+        filled = [i for i, (x, y, w, h) in enumerate(boxes)
+                  if cv2.countNonZero(mask_filled[y:y+h, x:x+w]) > cv2.countNonZero(mask_empty[y:y+h, x:x+w])]
+        for i, letter in zip(filled, box_letters(mask_filled, [boxes[i] for i in filled])):
+            if letter is not None:
+                values[i] = letter
+
     # Get centers
-    centers = [(x + w//2, y + h//2) for (x, y, w, h) in boxes]
+    centers = [(x + w//2, y + h//2, value) for (x, y, w, h), value in zip(boxes, values)]
 
     # Cluster Y into rows
     cell_h = int(np.median([h for (_, _, _, h) in boxes]))
     rows_dict = {}
-    for (cx, cy) in centers:
+    for (cx, cy, value) in centers:
         row = int(round(cy / cell_h))
-        rows_dict.setdefault(row, []).append((cx, cy))
+        rows_dict.setdefault(row, []).append((cx, cy, value))
 
     # Sort rows by Y
     rows = [rows_dict[k] for k in sorted(rows_dict.keys())]
 
     # Collect all X positions
-    xs = sorted([cx for (cx, _) in centers])
+    xs = sorted([cx for (cx, _, _) in centers])
     cell_w = int(np.median([w for (_, _, w, _) in boxes]))
 
     # Cluster X into columns
@@ -78,13 +155,83 @@ def extract_crossword_grid(image_path):
     matrix = []
     for row in rows:
         row_vec = [0] * len(cols)
-        for (cx, cy) in row:
+        for (cx, cy, value) in row:
             # find nearest column
             col_idx = np.argmin([abs(cx - c) for c in cols])
-            row_vec[col_idx] = 1
+            row_vec[col_idx] = value
         matrix.append(row_vec)
 
     return matrix
+
+
+def _bands(profile, min_length):
+    """(starts, ends) of the runs of True in profile that are at least min_length long."""
+    padded = np.concatenate(([False], profile, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    keep = ends - starts >= min_length
+    return starts[keep], ends[keep]
+
+
+def _band_sums(integral, row_bands, col_bands):
+    """Sums over every (row band, column band) rectangle, from an integral image (cv2.integral)."""
+    (row_starts, row_ends), (col_starts, col_ends) = row_bands, col_bands
+    return (integral[np.ix_(row_ends, col_ends)] - integral[np.ix_(row_starts, col_ends)]
+            - integral[np.ix_(row_ends, col_starts)] + integral[np.ix_(row_starts, col_starts)])
+
+
+def _grid_by_projection(cropped, read_letters, recorder):
+    """
+    Cells from the row and column projections of the color masks on the crop
+    downsampled to WORK_WIDTH: runs of mask rows (columns) are the cell rows
+    (columns), and a cell exists where its row and column bands overlap
+    mostly mask pixels. Projections and rectangle sums all come from the
+    integral images of the two masks.
+    """
+    h, w = cropped.shape[:2]
+    scale = min(1.0, WORK_WIDTH / w)
+    # Nearest neighbour keeps the exact cell colors for the masks
+    small = cv2.resize(cropped, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_NEAREST)
+    mask_empty = color_mask(small, EMPTY_COLOR, EMPTY_TOLERANCE)
+    mask_filled = color_mask(small, FILLED_COLOR, FILLED_TOLERANCE)
+    if recorder.enabled:
+        recorder.record('cmasked', cv2.bitwise_or(mask_empty, mask_filled))
+
+    # Mask pixels are 255, the two colors never overlap
+    empty = cv2.integral(mask_empty) // 255
+    filled = cv2.integral(mask_filled) // 255
+    total = empty + filled
+
+    # Same noise floor as the contour filter (10 px at full resolution)
+    min_size = max(1, int(10 * scale))
+    row_bands = _bands(np.diff(total[:, -1]) > min_size, min_size)
+    col_bands = _bands(np.diff(total[-1, :]) > min_size, min_size)
+    if not len(row_bands[0]) or not len(col_bands[0]):
+        return []
+
+    area = np.outer(row_bands[1] - row_bands[0], col_bands[1] - col_bands[0])
+    empty_sums = _band_sums(empty, row_bands, col_bands)
+    filled_sums = _band_sums(filled, row_bands, col_bands)
+    cells = (empty_sums + filled_sums) * 2 > area
+    revealed = cells & (filled_sums > empty_sums)
+
+    # Bands without a single cell are noise that crossed the threshold
+    rows_keep, cols_keep = cells.any(axis=1), cells.any(axis=0)
+    cells, revealed = cells[rows_keep][:, cols_keep], revealed[rows_keep][:, cols_keep]
+    matrix = cells.astype(int).tolist()
+
+    if read_letters and revealed.any():
+        # Boxes of the revealed cells back at full resolution
+        row_starts, row_ends = (band[rows_keep] / scale for band in row_bands)
+        col_starts, col_ends = (band[cols_keep] / scale for band in col_bands)
+        positions = np.argwhere(revealed)
+        boxes = [(int(col_starts[j]), int(row_starts[i]),
+                  int(col_ends[j] - col_starts[j]), int(row_ends[i] - row_starts[i])) for i, j in positions]
+        mask_filled = color_mask(cropped, FILLED_COLOR, FILLED_TOLERANCE)
+        for (i, j), letter in zip(positions, box_letters(mask_filled, boxes)):
+            if letter is not None:
+                matrix[i][j] = letter
+    return matrix
 '''
 
 [0, 0, 1, 0, 1, 0]
@@ -101,7 +248,7 @@ def matrix_to_crossword_image(matrix, cell_size=30, margin=20):
     Преобразует матрицу в изображение кроссворда.
     
     Args:
-        matrix: 2D список или numpy array с 0 и 1
+        matrix: 2D список или numpy array с 0, 1 и буквами открытых клеток
         cell_size: размер одной клетки в пикселях
         margin: отступ от краев изображения
     
@@ -109,7 +256,7 @@ def matrix_to_crossword_image(matrix, cell_size=30, margin=20):
         PIL Image object
     """
     # Преобразуем в numpy array для удобства
-    matrix = np.array(matrix)
+    matrix = np.array(matrix, dtype=object)
     rows, cols = matrix.shape
     
     # Размеры изображения
@@ -124,6 +271,13 @@ def matrix_to_crossword_image(matrix, cell_size=30, margin=20):
     BLACK = (0, 0, 0)
     WHITE = (255, 255, 255)
     GRAY = (200, 200, 200)
+    GOLD = (200, 160, 20)
+
+    # Шрифт с кириллицей для открытых букв, если он есть в системе
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", int(cell_size * 0.7))
+    except OSError:
+        font = ImageFont.load_default()
     
     # Рисуем сетку
     for i in range(rows + 1):
@@ -137,17 +291,63 @@ def matrix_to_crossword_image(matrix, cell_size=30, margin=20):
     # Заполняем клетки
     for i in range(rows):
         for j in range(cols):
-            if matrix[i, j] == 1:
+            value = matrix[i, j]
+            if not value:
+                continue
+            x1 = margin + j * cell_size
+            y1 = margin + i * cell_size
+            x2 = x1 + cell_size
+            y2 = y1 + cell_size
+            if isinstance(value, str):
+                # Открытая клетка с буквой
+                draw.rectangle([x1, y1, x2, y2], fill=GOLD)
+                left, top, right, bottom = draw.textbbox((0, 0), value.upper(), font=font)
+                draw.text(((x1 + x2 - right - left) / 2, (y1 + y2 - bottom - top) / 2),
+                          value.upper(), fill=WHITE, font=font)
+            else:
                 # Черная клетка (заполненная)
-                x1 = margin + j * cell_size
-                y1 = margin + i * cell_size
-                x2 = x1 + cell_size
-                y2 = y1 + cell_size
                 draw.rectangle([x1, y1, x2, y2], fill=BLACK)
     
     return img
 
+def compare_engines(directory):
+    """
+    Run both grid engines (without letter OCR) on every screenshot in
+    directory, print the images where they disagree and the mean time each.
+    """
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(('.png', '.jpg', '.jpeg')))
+    times = {engine: 0.0 for engine in GRID_ENGINES}
+    mismatches = 0
+    for path in paths:
+        img = load_image(path)
+        results = {}
+        for engine in GRID_ENGINES:
+            start = time.perf_counter()
+            results[engine] = extract_crossword_grid(img, read_letters=False, engine=engine)
+            times[engine] += time.perf_counter() - start
+        if results["contours"] != results["projection"]:
+            mismatches += 1
+            print(f"{path}: engines disagree")
+            for engine, matrix in results.items():
+                print(f"  {engine}:")
+                for row in matrix:
+                    print("   ", row)
+    print(f"{len(paths)} images, {mismatches} mismatches")
+    for engine, total in times.items():
+        print(f"{engine}: {total / max(len(paths), 1) * 1000:.2f} ms per image")
+
+
 if __name__ == "__main__":
-    path = "screenshot.png"
-    crossword = extract_crossword_grid(path)
-    img = matrix_to_crossword_image(crossword)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract the crossword grid from a screenshot")
+    parser.add_argument("path", nargs="?", default="screenshot.png", help="screenshot file")
+    parser.add_argument("-e", "--engine", choices=GRID_ENGINES, default="contours", help="grid detection engine")
+    parser.add_argument("--compare", metavar="DIR",
+                        help="compare the engines on every screenshot in DIR instead")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_engines(args.compare)
+    else:
+        crossword = extract_crossword_grid(args.path, recorder=FileRecorder("."), engine=args.engine)
+        img = matrix_to_crossword_image(crossword)
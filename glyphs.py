@@ -0,0 +1,80 @@
+"""
+In-process classifier for the letter glyphs of the wheel.
+
+The game draws its letters in a single font, so a glyph crop scaled onto a
+small square bitmap is matched against labelled bitmaps of the same kind:
+1-nearest neighbour by cosine similarity, one matrix product for all glyphs
+of a screenshot. A glyph without a clear match is reported as None and left
+to Tesseract (see letters.extract_cyrillic_letters).
+
+Templates are built from labelled screenshots with `python letters.py --train DIR`.
+"""
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# Side of the square bitmap glyphs are compared on
+GLYPH_SIZE = 20
+TEMPLATES_PATH = os.getenv("GLYPH_TEMPLATES", "glyph_templates.npz")
+
+# A match needs this cosine similarity, and this lead over the best other letter
+MIN_SIMILARITY = 0.9
+MIN_MARGIN = 0.03
+
+
+def normalize_glyph(glyph):
+    """Glyph (white on black) centered on a square, scaled to GLYPH_SIZE, flattened, mean-centered and scaled to unit length."""
+    h, w = glyph.shape[:2]
+    side = max(h, w)
+    square = np.zeros((side, side), dtype=np.uint8)
+    y, x = (side - h) // 2, (side - w) // 2
+    square[y:y + h, x:x + w] = glyph
+    vector = cv2.resize(square, (GLYPH_SIZE, GLYPH_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    # Centered, so the cosine is a correlation: bare ink overlap makes any two letters look alike
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class GlyphClassifier:
+    """Labelled glyph vectors (see normalize_glyph), one row per training glyph."""
+
+    def __init__(self, templates, labels):
+        self.templates = templates
+        self.labels = np.asarray(labels)
+        self.letters, self.label_ids = np.unique(self.labels, return_inverse=True)
+
+    @classmethod
+    def from_glyphs(cls, glyphs, labels):
+        return cls(np.stack([normalize_glyph(glyph) for glyph in glyphs]), list(labels))
+
+    def save(self, path):
+        np.savez_compressed(path, templates=self.templates, labels=self.labels)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["templates"], data["labels"])
+
+    def classify(self, glyphs, min_similarity=MIN_SIMILARITY, min_margin=MIN_MARGIN):
+        """Letter per glyph, or None where the best match is weak or too close to another letter."""
+        if not glyphs:
+            return []
+        similarity = np.stack([normalize_glyph(glyph) for glyph in glyphs]) @ self.templates.T
+        best = similarity.argmax(axis=1)
+        best_similarity = similarity[np.arange(len(glyphs)), best]
+        # Best similarity among the templates of every other letter
+        same_letter = self.label_ids[None, :] == self.label_ids[best][:, None]
+        runner_up = np.where(same_letter, -1.0, similarity).max(axis=1)
+        confident = (best_similarity >= min_similarity) & (best_similarity - runner_up >= min_margin)
+        return [str(self.labels[i]) if ok else None for i, ok in zip(best, confident)]
+
+
+@lru_cache(maxsize=None)
+def load_classifier(path=TEMPLATES_PATH):
+    """The classifier saved at path, or None if no templates have been trained."""
+    if not os.path.exists(path):
+        return None
+    return GlyphClassifier.load(path)
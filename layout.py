@@ -0,0 +1,132 @@
+"""
+Where the crossword grid and the letter wheel are on a screenshot.
+
+One pass over a small nearest-neighbour copy of the screenshot masks the
+cell colors and the wheel letter color and takes the bounding boxes of their
+blobs, so the extractors crop just those regions whatever the device's
+aspect ratio. A region that isn't found falls back to the fixed
+screen fractions the extractors always used.
+"""
+import cv2
+import numpy as np
+
+# Cell colors (BGR) and inRange tolerances
+EMPTY_COLOR, EMPTY_TOLERANCE = np.array([98, 107, 20]), 10    # RGB 20, 107, 98
+FILLED_COLOR, FILLED_TOLERANCE = np.array([31, 231, 251]), 30  # RGB 251, 231, 31
+# Letters on the wheel
+WHEEL_COLOR, WHEEL_TOLERANCE = np.array([98, 108, 38]), 30    # RGB 38, 108, 98
+
+# Fallback regions as (x1, y1, x2, y2) fractions of the screenshot
+GRID_FRACTIONS = (0.0, 0.19, 1.0, 0.60)
+WHEEL_FRACTIONS = (0.15, 0.65, 0.85, 0.90)
+
+# Width of the copy the layout is detected on
+LAYOUT_WIDTH = 135
+
+# Cell blobs at least this share of the biggest one's area, level with it or
+# above/below it, are part of the grid: word clusters that don't cross the
+# main one are often a cell or more away from it, further than the dilation
+# joins. Smaller blobs are noise, blobs off to a corner are buttons and icons.
+GRID_MIN_SHARE = 0.02
+
+
+def color_mask(image, target_color, tolerance):
+    """inRange mask of the pixels within tolerance of target_color."""
+    lower_bound = np.maximum(target_color - tolerance, 0)
+    upper_bound = np.minimum(target_color + tolerance, 255)
+    return cv2.inRange(image, lower_bound, upper_bound)
+
+
+def fraction_box(shape, fractions):
+    """Pixel box (x1, y1, x2, y2) of an image of this shape for a box in fractions."""
+    h, w = shape[:2]
+    x1, y1, x2, y2 = fractions
+    return int(w * x1), int(h * y1), int(w * x2), int(h * y2)
+
+
+def crop(img, box):
+    x1, y1, x2, y2 = box
+    return img[y1:y2, x1:x2]
+
+
+class Layout:
+    """Pixel boxes (x1, y1, x2, y2) of the grid and of the wheel letters on the screenshot."""
+
+    def __init__(self, grid, wheel):
+        self.grid = grid
+        self.wheel = wheel
+
+    @classmethod
+    def fixed(cls, shape):
+        """The fixed-fraction layout for a screenshot of this shape."""
+        return cls(fraction_box(shape, GRID_FRACTIONS), fraction_box(shape, WHEEL_FRACTIONS))
+
+
+def _blobs_box(mask, kernel_size, min_share=1.0, aligned=False):
+    """
+    Bounding box (x1, y1, x2, y2) of the blobs of mask dilated by kernel_size
+    whose area is at least min_share of the largest one's (1.0: the largest
+    blob only), or None if there are none. With aligned, only blobs that
+    share rows or columns with the largest one count.
+    """
+    if not cv2.countNonZero(mask):
+        return None
+    merged = cv2.dilate(mask, np.ones((kernel_size, kernel_size), np.uint8))
+    count, _, stats, _ = cv2.connectedComponentsWithStats(merged)
+    if count < 2:
+        return None
+    # Label 0 is the background
+    stats = stats[1:]
+    areas = stats[:, cv2.CC_STAT_AREA]
+    x1, y1 = stats[:, 0], stats[:, 1]
+    x2, y2 = x1 + stats[:, 2], y1 + stats[:, 3]
+    keep = areas >= areas.max() * min_share
+    if aligned:
+        i = areas.argmax()
+        keep &= ((x1 < x2[i]) & (x2 > x1[i])) | ((y1 < y2[i]) & (y2 > y1[i]))
+    return x1[keep].min(), y1[keep].min(), x2[keep].max(), y2[keep].max()
+
+
+def _to_full(box, scale, shape, margin):
+    """Box on the small copy scaled back to the screenshot, grown by margin pixels and clipped."""
+    h, w = shape[:2]
+    x1, y1, x2, y2 = box
+    return (max(0, int(x1 / scale) - margin), max(0, int(y1 / scale) - margin),
+            min(w, int(x2 / scale) + margin), min(h, int(y2 / scale) + margin))
+
+
+def detect_layout(img):
+    """
+    Layout of a BGR screenshot. The grid is the box around the blobs of cell
+    colors (cells merge into word clusters once the mask is dilated a little)
+    that are at least GRID_MIN_SHARE of the biggest one and share rows or
+    columns with it; the wheel is the
+    box around the letter-color blobs below the grid that are at least a
+    quarter the size of the biggest one (the letters; smaller blobs are
+    noise). Either one falls back to its fixed fractions if it is missing or
+    implausibly small.
+    """
+    layout = Layout.fixed(img.shape)
+    h, w = img.shape[:2]
+    scale = min(1.0, LAYOUT_WIDTH / w)
+    small = cv2.resize(img, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_NEAREST)
+    # One small-copy pixel is 1 / scale screenshot pixels; that much slack keeps edge cells whole
+    margin = int(2 / scale)
+
+    cells = cv2.bitwise_or(color_mask(small, EMPTY_COLOR, EMPTY_TOLERANCE),
+                           color_mask(small, FILLED_COLOR, FILLED_TOLERANCE))
+    # Opening drops thin strokes that happen to match a cell color (e.g. letter edges)
+    cells = cv2.morphologyEx(cells, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    grid = _blobs_box(cells, 3, min_share=GRID_MIN_SHARE, aligned=True)
+    if grid is not None and grid[3] - grid[1] >= 2 and grid[2] - grid[0] >= 2:
+        layout.grid = _to_full(grid, scale, img.shape, margin)
+
+    # Wheel letters: only below the grid, so empty cells can't be taken for them
+    below = layout.grid[3] * small.shape[0] // h
+    letters = color_mask(small, WHEEL_COLOR, WHEEL_TOLERANCE)
+    letters[:below] = 0
+    letters = cv2.bitwise_and(letters, cv2.bitwise_not(cells))
+    wheel = _blobs_box(letters, 3, min_share=0.25)
+    if wheel is not None and wheel[2] - wheel[0] >= small.shape[1] // 5:
+        layout.wheel = _to_full(wheel, scale, img.shape, margin)
+    return layout
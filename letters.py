@@ -1,3 +1,4 @@
+import argparse
 import re
 import cv2
 import os
@@ -5,18 +6,34 @@ import numpy as np
 import pytesseract
 import tempfile
 
+from artifacts import NO_RECORDER, FileRecorder
+from glyphs import TEMPLATES_PATH, GlyphClassifier, load_classifier
+from layout import WHEEL_COLOR, WHEEL_TOLERANCE, color_mask, crop, detect_layout
+from ocr_pool import TESSERACT_LANG, get_ocr_pool, tesseract_config
+
+
+def _ocr_input(image):
+    """Glyphs (white on black) inverted and upscaled 10x for Tesseract."""
+    image = cv2.bitwise_not(image)
+    h,w = image.shape[:2]
+    return cv2.resize(image, (w*10, h*10), interpolation=cv2.INTER_CUBIC)
+
 
 def ocr_tesseract_optimized(image):
-    """Optimized Tesseract with multiple attempts and TIFF conversion"""
+    """
+    Optimized Tesseract: read by a worker of the OCR pool (see ocr_pool), or
+    with multiple attempts and TIFF conversion if the pool is off (OCR_WORKERS=0
+    or no tesserocr)
+    """
+    image = _ocr_input(image)
+    pool = get_ocr_pool()
+    if pool is not None:
+        return pool.read(image).strip().upper()
 
     # Try different PSM modes
     psm_modes = [6,]
     best_text = ""
     
-    # Invert colors
-    image = cv2.bitwise_not(image)
-    h,w = image.shape[:2]
-    image = cv2.resize(image, (w*10, h*10), interpolation=cv2.INTER_CUBIC)
     with tempfile.NamedTemporaryFile(suffix='.tiff', delete=False) as temp_file:
         temp_filename = temp_file.name
     
@@ -26,8 +43,7 @@ def ocr_tesseract_optimized(image):
         tiff_image = cv2.imread(temp_filename)
         
         for psm in psm_modes:
-            config = f'--oem 3 --psm {psm} -c tessedit_char_whitelist=АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
-            text = pytesseract.image_to_string(tiff_image, lang='rus', config=config)
+            text = pytesseract.image_to_string(tiff_image, lang=TESSERACT_LANG, config=tesseract_config(psm))
             
             # Check if this gives more Cyrillic letters
             cyrillic_count = len(re.findall(r'[А-ЯЁ]', text))
@@ -42,6 +58,14 @@ def ocr_tesseract_optimized(image):
     return best_text.strip().upper()
 
 
+def ocr_tesseract_many(images):
+    """ocr_tesseract_optimized of every image, read in parallel by the OCR pool."""
+    pool = get_ocr_pool()
+    if pool is None:
+        return [ocr_tesseract_optimized(image) for image in images]
+    return [text.strip().upper() for text in pool.read_many([_ocr_input(image) for image in images])]
+
+
 # def ocr_easyocr(image):
 #     """Use EasyOCR for Cyrillic text recognition"""
 #     reader = easyocr.Reader(['ru'], gpu=False)  # Set gpu=True if you have CUDA
@@ -58,36 +82,84 @@ def ocr_tesseract_optimized(image):
 #     text = ' '.join(results)
 #     return text.upper()
 
-def extract_cyrillic_letters(image_path):
-    # Load image
-    img = cv2.imread(image_path)
-    h, w, _ = img.shape
+def ocr_glyphs(glyphs, per_glyph=True):
+    """
+    Tesseract for separate glyphs (white on black): one call for all of them
+    joined, or, if the joined line is misread, one call per glyph (all None
+    with per_glyph=False).
+    Returns an uppercase letter per glyph, or None where it could not be read.
+    """
+    if not glyphs:
+        return []
+    found = re.findall(r'[А-ЯЁ]', ocr_tesseract_optimized(join_letter_images(glyphs)))
+    if len(found) == len(glyphs):
+        return found
+    if not per_glyph:
+        return [None] * len(glyphs)
 
-    # Crop bottom area (where the circle with letters is)
-    # Adjust values if needed depending on screenshots
-    y1 = int(h * 0.65)   # start ~65% down the screen
-    y2 = int(h*0.90)               # bottom of image
-    x1 = int(w * 0.15)   # left margin
-    x2 = int(w * 0.85)   # right margin
-    cropped = img[y1:y2, x1:x2]
+    letters = []
+    for text in ocr_tesseract_many([join_letter_images([glyph]) for glyph in glyphs]):
+        found = re.findall(r'[А-ЯЁ]', text)
+        letters.append(found[0] if len(found) == 1 else None)
+    return letters
 
-    target_color = np.array([98, 108, 38])  # BGR equivalent of RGB(38, 108, 98)
 
-    tolerance = 30
+def load_image(image):
+    """BGR image from a path, or the image itself if it is already decoded (ndarray)."""
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imread(image)
+
+
+def decode_image(data):
+    """Decode image file bytes (e.g. a downloaded photo) into a BGR ndarray; None if unreadable."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def join_letter_images(letter_images):
+    """Scale binary glyphs (white on black) to one height and join them left to right with padding."""
+    # Find max height to resize all letters to same height
+    max_height = max(img.shape[0] for img in letter_images)
+    
+    # Resize all letters to have same height and add black padding
+    resized_letters = []
+    for letter in letter_images:
+        # Calculate aspect ratio
+        h, w = letter.shape
+        aspect_ratio = w / h
+        new_w = int(max_height * aspect_ratio)
+        
+        # Resize letter
+        resized = cv2.resize(letter, (new_w, max_height))
+        
+        # Add black padding around the letter (0 = black)
+        padded = np.zeros((max_height + 20, new_w + 20), dtype=np.uint8)
+        padded[10:10+max_height, 10:10+new_w] = resized
+        
+        resized_letters.append(padded)
+    
+    # Combine all letters horizontally
+    return np.hstack(resized_letters)
 
-    lower_bound = np.maximum(target_color - tolerance, 0)
-    upper_bound = np.minimum(target_color + tolerance, 255)
 
-    mask = cv2.inRange(cropped, lower_bound, upper_bound)
+def segment_wheel_letters(img, recorder=NO_RECORDER, layout=None):
+    """Glyph crops (white on black) of the wheel letters, left to right."""
+    if layout is None:
+        layout = detect_layout(img)
+
+    # Crop the area with the circle of letters
+    cropped = crop(img, layout.wheel)
+
+    mask = color_mask(cropped, WHEEL_COLOR, WHEEL_TOLERANCE)
 
-    cropped = cv2.bitwise_and(cropped, cropped, mask=mask)
     result = np.zeros_like(cropped)
     result[mask > 0] = [255, 255, 255] 
 
     # Convert to grayscale for processing
     gray = cv2.cvtColor(result, cv2.COLOR_BGR2GRAY)
 
-    cv2.imwrite('new.png', result)
+    if recorder.enabled:
+        recorder.record('new', result)
 
     # Apply threshold to get binary image (white letters on black background)
     _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
@@ -111,41 +183,82 @@ def extract_cyrillic_letters(image_path):
     for x, y, w, h in letter_contours:
         letter_img = thresh[y:y+h, x:x+w]
         letter_images.append(letter_img)
+    return letter_images
+
+
+def extract_cyrillic_letters(image, recorder=NO_RECORDER, layout=None, classifier=None):
+    """
+    Letters of the wheel; image is a screenshot path or an already decoded
+    BGR ndarray. Debug images go to recorder (see artifacts). layout is the
+    screenshot's layout.Layout, detected here if not given.
+
+    Glyphs are read by the glyph classifier (the trained templates by
+    default, see glyphs); Tesseract only reads the glyphs it is not sure
+    about, or all of them if there are no templates.
+    """
+    # Load image
+    img = load_image(image)
+    letter_images = segment_wheel_letters(img, recorder, layout)
     
     # Join letters horizontally
     if letter_images:
-        # Find max height to resize all letters to same height
-        max_height = max(img.shape[0] for img in letter_images)
-        
-        # Resize all letters to have same height and add black padding
-        resized_letters = []
-        for letter in letter_images:
-            # Calculate aspect ratio
-            h, w = letter.shape
-            aspect_ratio = w / h
-            new_w = int(max_height * aspect_ratio)
-            
-            # Resize letter
-            resized = cv2.resize(letter, (new_w, max_height))
-            
-            # Add black padding around the letter (0 = black)
-            padded = np.zeros((max_height + 20, new_w + 20), dtype=np.uint8)
-            padded[10:10+max_height, 10:10+new_w] = resized
-            
-            resized_letters.append(padded)
-        
-        # Combine all letters horizontally
-        combined_image = np.hstack(resized_letters)
+        combined_image = join_letter_images(letter_images)
         
         # Save the combined image
-        cv2.imwrite('combined_letters.png', combined_image)
-        
-        # Perform OCR on the combined image
-        return ocr_tesseract_optimized(combined_image)
+        if recorder.enabled:
+            recorder.record('combined_letters', combined_image)
+
+        if classifier is None:
+            classifier = load_classifier()
+        if classifier is None:
+            # Perform OCR on the combined image
+            return ocr_tesseract_optimized(combined_image)
+
+        letters = classifier.classify(letter_images)
+        unsure = [i for i, letter in enumerate(letters) if letter is None]
+        for i, letter in zip(unsure, ocr_glyphs([letter_images[i] for i in unsure])):
+            letters[i] = letter
+        return "".join(letter for letter in letters if letter is not None)
     
     return "No letters found"
 
+
+def train_templates(directory, out=TEMPLATES_PATH):
+    """
+    Build glyph templates from labelled screenshots: the file name up to the
+    first "_" or "." is the wheel letters in left-to-right order (e.g.
+    "ПРОЗАИК_3.png"). Screenshots where the number of glyphs found doesn't
+    match the label are skipped.
+    """
+    glyphs, labels = [], []
+    used = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        label = os.path.splitext(name)[0].split("_")[0].upper()
+        found = segment_wheel_letters(load_image(os.path.join(directory, name)))
+        if len(found) != len(label):
+            print(f"{name}: {len(found)} glyphs for label {label!r}, skipped")
+            continue
+        glyphs.extend(found)
+        labels.extend(label)
+        used += 1
+    if not glyphs:
+        raise ValueError(f"No usable labelled screenshots in {directory}")
+    GlyphClassifier.from_glyphs(glyphs, labels).save(out)
+    print(f"{len(glyphs)} glyphs of {len(set(labels))} letters from {used} screenshots -> {out}")
+
+
 if __name__ == "__main__":
-    path = "screenshot.png"  # Replace with your screenshot file
-    letters = extract_cyrillic_letters(path)
-    print("Extracted letters:", letters)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Read the wheel letters from a screenshot")
+    parser.add_argument("path", nargs="?", default="screenshot.png", help="screenshot file")
+    parser.add_argument("--train", metavar="DIR",
+                        help="build glyph templates from the labelled screenshots in DIR instead")
+    parser.add_argument("-o", "--out", default=TEMPLATES_PATH, help="where --train saves the templates")
+    args = parser.parse_args()
+
+    if args.train:
+        train_templates(args.train, args.out)
+    else:
+        letters = extract_cyrillic_letters(args.path, recorder=FileRecorder("."))
+        print("Extracted letters:", letters)
\ No newline at end of file
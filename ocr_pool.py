@@ -0,0 +1,338 @@
+"""
+Long-lived Tesseract workers.
+
+pytesseract runs the tesseract binary for every image, and every run loads
+the rus traineddata again. An OcrPool keeps worker processes that load the
+model once through tesserocr and reads images they get over their stdin
+pipe as raw pixel buffers: no temp files, no process start per image.
+Several images are read in parallel, one per worker.
+
+A worker that dies is restarted on its next use; one that stops answering
+(request timeout or a failed health-check ping) is killed first.
+
+The pool needs tesserocr (its wheels bundle libtesseract; the model comes
+from TESSDATA_PREFIX, see the Dockerfile); without it get_ocr_pool()
+returns None and callers keep using pytesseract directly.
+"""
+import atexit
+import importlib.util
+import logging
+import os
+import queue
+import selectors
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TESSERACT_LANG = "rus"
+TESSERACT_PSM = 6  # a single uniform block of text
+TESSERACT_WHITELIST = "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+
+# Workers in the shared pool (0 turns it off and every call runs pytesseract)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# Seconds a worker gets for one image, and to load the model when it starts
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "10"))
+OCR_START_TIMEOUT = float(os.getenv("OCR_START_TIMEOUT", "30"))
+# Seconds between health checks of the idle workers (0: no background checks)
+OCR_HEALTH_INTERVAL = float(os.getenv("OCR_HEALTH_INTERVAL", "60"))
+PING_TIMEOUT = 2.0
+
+logger = logging.getLogger(__name__)
+
+# Request: kind, height, width, channels, then height * width * channels pixel bytes.
+# Reply: status, length, then length bytes of UTF-8 (the text, engine name or error).
+REQUEST = struct.Struct("<BIII")
+REPLY = struct.Struct("<BI")
+READ, PING = 1, 2
+READY, OK, ERROR = 1, 2, 3
+
+
+def tesseract_config(psm=TESSERACT_PSM, whitelist=TESSERACT_WHITELIST):
+    """pytesseract config string for these settings."""
+    return f"--oem 3 --psm {psm} -c tessedit_char_whitelist={whitelist}"
+
+
+class WorkerLost(Exception):
+    """The worker process exited or closed its pipe."""
+
+
+def _make_reader(lang, psm, whitelist):
+    """(engine name, function from a uint8 image to its text), with the model loaded once."""
+    import tesserocr
+
+    api = tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+    api.SetVariable("tessedit_char_whitelist", whitelist)
+
+    def read(image):
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return api.GetUTF8Text()
+
+    return "tesserocr", read
+
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def serve(lang, psm, whitelist):
+    """Worker loop: answer requests from stdin on stdout until stdin is closed."""
+    # The protocol owns the original stdout; anything the engine prints goes to stderr
+    out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+    stdin = sys.stdin.buffer
+
+    def reply(status, text):
+        data = text.encode()
+        out.write(REPLY.pack(status, len(data)) + data)
+        out.flush()
+
+    try:
+        engine, read = _make_reader(lang, psm, whitelist)
+    except Exception as error:
+        reply(ERROR, repr(error))
+        return
+    reply(READY, engine)
+
+    while True:
+        header = _read_exact(stdin, REQUEST.size)
+        if header is None:
+            return
+        kind, height, width, channels = REQUEST.unpack(header)
+        if kind == PING:
+            reply(OK, "")
+            continue
+        pixels = _read_exact(stdin, height * width * channels)
+        if pixels is None:
+            return
+        shape = (height, width) if channels == 1 else (height, width, channels)
+        try:
+            reply(OK, read(np.frombuffer(pixels, dtype=np.uint8).reshape(shape)))
+        except Exception as error:
+            reply(ERROR, repr(error))
+
+
+class OcrWorker:
+    """One worker process and its pipes; used by one thread at a time."""
+
+    def __init__(self, args):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), *args],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self.engine = None
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.process.stdout, selectors.EVENT_READ)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def wait_ready(self, timeout):
+        """Wait for the worker to load the model; returns its engine name."""
+        status, text = self._receive(timeout)
+        if status != READY:
+            raise RuntimeError(f"OCR worker failed to start: {text}")
+        self.engine = text
+        return text
+
+    def request(self, kind, image=None, timeout=OCR_TIMEOUT):
+        """Send one request and return (status, text) of the reply."""
+        if image is None:
+            header = REQUEST.pack(kind, 0, 0, 0)
+        else:
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            channels = 1 if image.ndim == 2 else image.shape[2]
+            header = REQUEST.pack(kind, image.shape[0], image.shape[1], channels)
+        try:
+            self.process.stdin.write(header)
+            if image is not None:
+                self.process.stdin.write(memoryview(image).cast("B"))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as error:
+            raise WorkerLost() from error
+        return self._receive(timeout)
+
+    def _receive(self, timeout):
+        deadline = time.monotonic() + timeout
+        status, length = REPLY.unpack(self._read(REPLY.size, deadline))
+        return status, self._read(length, deadline).decode()
+
+    def _read(self, size, deadline):
+        data = b""
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._selector.select(remaining):
+                raise TimeoutError("OCR worker did not answer in time")
+            chunk = os.read(self.process.stdout.fileno(), size - len(data))
+            if not chunk:
+                raise WorkerLost()
+            data += chunk
+        return data
+
+    def stop(self, timeout=1.0):
+        """Close the pipe so the worker exits, killing it if it doesn't."""
+        self._selector.close()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+class OcrPool:
+    """
+    size long-lived OCR workers. read() and read_many() are thread-safe; a
+    call waits for a free worker.
+    """
+
+    def __init__(self, size=OCR_WORKERS, lang=TESSERACT_LANG, psm=TESSERACT_PSM,
+                 whitelist=TESSERACT_WHITELIST, timeout=OCR_TIMEOUT,
+                 health_interval=OCR_HEALTH_INTERVAL):
+        if size < 1:
+            raise ValueError(f"OCR pool size must be at least 1, got {size}")
+        self.size = size
+        self.timeout = timeout
+        self._args = ["--serve", lang, str(psm), whitelist]
+        self._idle = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ocr")
+        self._closed = threading.Event()
+        self.restarts = 0
+
+        # Start all of them first, so the models load in parallel
+        workers = [OcrWorker(self._args) for _ in range(size)]
+        try:
+            for worker in workers:
+                worker.wait_ready(OCR_START_TIMEOUT)
+        except BaseException:
+            for worker in workers:
+                worker.stop()
+            raise
+        self.engine = workers[0].engine
+        for worker in workers:
+            self._idle.put(worker)
+
+        if health_interval > 0:
+            threading.Thread(target=self._monitor, args=(health_interval,), daemon=True).start()
+
+    def _restart(self, worker):
+        worker.stop(timeout=0)
+        self.restarts += 1
+        worker = OcrWorker(self._args)
+        worker.wait_ready(OCR_START_TIMEOUT)
+        return worker
+
+    def read(self, image):
+        """Text Tesseract reads on a uint8 image (grayscale or RGB)."""
+        if self._closed.is_set():
+            raise RuntimeError("OCR pool is closed")
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker = self._restart(worker)
+            try:
+                status, text = worker.request(READ, image, self.timeout)
+            except WorkerLost:
+                # Crashed on this image or before it: one more try on a fresh worker
+                worker = self._restart(worker)
+                status, text = worker.request(READ, image, self.timeout)
+        except TimeoutError:
+            # Kill it; the next read() that gets it starts a fresh one
+            worker.stop(timeout=0)
+            raise
+        finally:
+            self._idle.put(worker)
+        if status != OK:
+            raise RuntimeError(f"OCR worker error: {text}")
+        return text
+
+    def read_many(self, images):
+        """read() of every image, spread over the workers; texts in the same order."""
+        return list(self._executor.map(self.read, images))
+
+    def check_health(self):
+        """
+        Ping the idle workers and restart those that don't answer (busy ones
+        are skipped). Returns the number of workers restarted.
+        """
+        restarted = 0
+        for _ in range(self.size):
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                try:
+                    healthy = worker.request(PING, timeout=PING_TIMEOUT)[0] == OK
+                except (WorkerLost, TimeoutError):
+                    healthy = False
+                if not healthy:
+                    worker = self._restart(worker)
+                    restarted += 1
+            finally:
+                self._idle.put(worker)
+        return restarted
+
+    def _monitor(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.check_health()
+            except Exception as error:
+                logger.warning(f"OCR pool health check failed: {error!r}")
+
+    def close(self):
+        """Stop the workers, waiting for the ones busy with an image."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._executor.shutdown()
+        for _ in range(self.size):
+            self._idle.get().stop()
+
+
+_shared_pool = None
+_shared_pool_failed = False
+_shared_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """
+    The shared pool of OCR_WORKERS workers, started on first use; None if
+    OCR_WORKERS is 0, tesserocr is not installed or the workers failed to
+    start (e.g. no traineddata under TESSDATA_PREFIX).
+    """
+    global _shared_pool, _shared_pool_failed
+    if OCR_WORKERS < 1 or importlib.util.find_spec("tesserocr") is None:
+        return None
+    with _shared_pool_lock:
+        if _shared_pool is None and not _shared_pool_failed:
+            try:
+                _shared_pool = OcrPool(OCR_WORKERS)
+            except (OSError, RuntimeError, TimeoutError, WorkerLost) as error:
+                _shared_pool_failed = True
+                logger.warning(f"OCR pool not started, reading with pytesseract: {error}")
+                return None
+            atexit.register(_shared_pool.close)
+        return _shared_pool
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["--serve"] or len(sys.argv) != 5:
+        sys.exit("usage: ocr_pool.py --serve LANG PSM WHITELIST (started by OcrPool)")
+    serve(sys.argv[2], int(sys.argv[3]), sys.argv[4])
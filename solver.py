@@ -1,7 +1,19 @@
-from itertools import permutations
+import heapq
+import multiprocessing
+import os
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice, permutations
 
 
 def find_word_slots(matrix):
+    """
+    Runs of two or more cells, horizontal first. A cell is any truthy value:
+    1 for an empty cell or the letter of an already revealed one.
+    """
     slots = []
     rows, cols = len(matrix), len(matrix[0])
 
@@ -9,9 +21,9 @@ def find_word_slots(matrix):
     for r in range(rows):
         c = 0
         while c < cols:
-            if matrix[r][c] == 1:
+            if matrix[r][c]:
                 start = c
-                while c < cols and matrix[r][c] == 1:
+                while c < cols and matrix[r][c]:
                     c += 1
                 length = c - start
                 if length > 1:
@@ -23,9 +35,9 @@ def find_word_slots(matrix):
     for c in range(cols):
         r = 0
         while r < rows:
-            if matrix[r][c] == 1:
+            if matrix[r][c]:
                 start = r
-                while r < rows and matrix[r][c] == 1:
+                while r < rows and matrix[r][c]:
                     r += 1
                 length = r - start
                 if length > 1:
@@ -36,53 +48,239 @@ def find_word_slots(matrix):
     return slots
 
 
-def build_constraints(slots):
-    """Find intersections between slots."""
+def build_cell_map(slots):
+    """Map every cell to the (slot, offset) pairs that cover it."""
+    cells = {}
+    for i, slot in enumerate(slots):
+        for offset, cell in enumerate(slot):
+            cells.setdefault(cell, []).append((i, offset))
+    return cells
+
+
+def build_constraints(slots, cells=None):
+    """Find intersections between slots in one pass over the cell map."""
+    if cells is None:
+        cells = build_cell_map(slots)
     constraints = {}
-    for i, slot1 in enumerate(slots):
-        for j, slot2 in enumerate(slots):
-            if i >= j:
-                continue
-            for idx1, pos1 in enumerate(slot1):
-                if pos1 in slot2:
-                    idx2 = slot2.index(pos1)
-                    constraints.setdefault(i, []).append((j, idx1, idx2))
-                    constraints.setdefault(j, []).append((i, idx2, idx1))
+    for entries in cells.values():
+        for a, (i, idx1) in enumerate(entries):
+            for j, idx2 in entries[a + 1:]:
+                constraints.setdefault(i, []).append((j, idx1, idx2))
+                constraints.setdefault(j, []).append((i, idx2, idx1))
+    for links in constraints.values():
+        links.sort()
     return constraints
 
 
-def backtrack(slots, words_dict, constraints, assignment=None, used=None, slot_idx=0):
+def fixed_letters(matrix, slots):
+    """Per slot, the (offset, letter) pairs of its revealed (letter) cells."""
+    return [
+        [(offset, matrix[r][c]) for offset, (r, c) in enumerate(slot) if isinstance(matrix[r][c], str)]
+        for slot in slots
+    ]
+
+
+class GridSlots:
+    """
+    Slots of a grid, the cell -> [(slot, offset)] map, the slot constraints
+    and the revealed letters of every slot (see fixed_letters).
+    """
+
+    def __init__(self, slots, cells, constraints, fixed=None):
+        self.slots = slots
+        self.cells = cells
+        self.constraints = constraints
+        self.fixed = fixed if fixed is not None else [[] for _ in slots]
+
+    def revealed_words(self):
+        """Words of the slots whose every cell is already revealed, by slot."""
+        return {
+            i: "".join(letter for _, letter in fixed)
+            for i, (slot, fixed) in enumerate(zip(self.slots, self.fixed)) if len(fixed) == len(slot)
+        }
+
+    def with_revealed(self, words_dict):
+        """
+        words_dict plus the fully revealed words that are not in it, so a
+        slot the game has already solved is accepted even when the word is
+        missing from the dictionary. Returns words_dict itself if nothing is added.
+        """
+        extra = {}
+        for word in self.revealed_words().values():
+            if word not in words_dict.get(len(word), ()) and word not in extra.get(len(word), ()):
+                extra.setdefault(len(word), []).append(word)
+        if not extra:
+            return words_dict
+        merged = dict(words_dict)
+        for length, words in extra.items():
+            merged[length] = list(merged.get(length, [])) + words
+        return merged
+
+    def domains(self, index):
+        """Initial per-slot domains: the words of the slot's length that fit its revealed letters."""
+        return [index.compatible(len(slot), fixed) for slot, fixed in zip(self.slots, self.fixed)]
+
+
+@lru_cache(maxsize=256)
+def _grid_slots(key):
+    slots = find_word_slots(key)
+    cells = build_cell_map(slots)
+    return GridSlots(slots, cells, build_constraints(slots, cells), fixed_letters(key, slots))
+
+
+def grid_slots(matrix):
+    """
+    Slot structure for the matrix, memoized by its contents so re-solving
+    the same grid (e.g. with corrected letters) skips slot and constraint
+    extraction. The result is shared and must not be modified.
+
+    Cells are 0 (no cell), 1 (empty cell) or the lowercase letter of a
+    revealed cell; revealed letters narrow the slot domains before search.
+    """
+    return _grid_slots(tuple(tuple(row) for row in matrix))
+
+
+class PositionIndex:
+    """
+    Per word length: the candidate words and, for every (position, letter),
+    a bitset (int) of the ids of words with that letter at that position.
+    Candidates that fit all crossing letters of a slot are then one AND of
+    a few bitsets instead of a scan over words_dict[length].
+
+    For the search core the words are also integer-encoded: every letter gets
+    a code, codes[length] holds the words' letter codes row by row,
+    letter_bits[length][pos][code] is the bitset for that letter at pos,
+    gids[length][id] is a global id per distinct word (for the used-words
+    bitset) and same_ids[length][id] the bitset of all ids of that word.
+    """
+
+    def __init__(self, words_dict):
+        self.words = {}
+        self.full = {}
+        self.by_letter = {}
+        self.word_bits = {}
+        self.positions = {}
+        self.codes = {}
+        self.gids = {}
+        self.same_ids = {}
+        self.letter_bits = {}
+        self.letter_codes = {}
+        self._word_gids = {}
+        for length, words in words_dict.items():
+            self.set_words(length, words)
+
+    def set_words(self, length, words):
+        """(Re)build the entries of one word length; the other lengths are kept as they are."""
+        words = list(words)
+        by_letter = {}
+        word_bits = {}
+        for i, word in enumerate(words):
+            bit = 1 << i
+            for pos, letter in enumerate(word):
+                key = (pos, letter)
+                by_letter[key] = by_letter.get(key, 0) | bit
+            word_bits[word] = word_bits.get(word, 0) | bit
+        positions = {}
+        for (pos, letter), bits in by_letter.items():
+            positions.setdefault(pos, []).append((letter, bits))
+        self.words[length] = words
+        self.full[length] = (1 << len(words)) - 1
+        self.by_letter[length] = by_letter
+        self.word_bits[length] = word_bits
+        self.positions[length] = positions
+
+        letter_codes = self.letter_codes
+        n_codes = len(letter_codes)
+        codes = array("H")
+        for word in words:
+            codes.extend(letter_codes.setdefault(letter, len(letter_codes)) for letter in word)
+        self.codes[length] = codes
+        self.gids[length] = array("l", (self._word_gids.setdefault(word, len(self._word_gids)) for word in words))
+        self.same_ids[length] = [word_bits[word] for word in words]
+        if len(letter_codes) > n_codes:
+            # New letters: widen the code tables of the other lengths
+            for tables in self.letter_bits.values():
+                for table in tables:
+                    table.extend([0] * (len(letter_codes) - len(table)))
+        tables = [[0] * len(letter_codes) for _ in range(length)]
+        for pos, pairs in positions.items():
+            for letter, bits in pairs:
+                tables[pos][letter_codes[letter]] = bits
+        self.letter_bits[length] = tables
+
+    def with_letter(self, length, pos, letter):
+        """Bitset of words of the given length with letter at pos."""
+        return self.by_letter.get(length, {}).get((pos, letter), 0)
+
+    def same_word(self, length, word):
+        """Bitset of all ids of word (duplicates in words_dict get several ids)."""
+        return self.word_bits.get(length, {}).get(word, 0)
+
+    def letters_at(self, length, pos):
+        """(letter, bitset) pairs for every letter seen at pos in words of this length."""
+        return self.positions.get(length, {}).get(pos, [])
+
+    def compatible(self, length, fixed):
+        """Bitset of words of the given length matching all (pos, letter) pairs."""
+        bits = self.full.get(length, 0)
+        by_letter = self.by_letter.get(length, {})
+        for key in fixed:
+            bits &= by_letter.get(key, 0)
+            if not bits:
+                break
+        return bits
+
+    def iter_words(self, length, bits):
+        """Words for the set bits, in words_dict order."""
+        words = self.words.get(length, ())
+        while bits:
+            low = bits & -bits
+            yield words[low.bit_length() - 1]
+            bits ^= low
+
+    @staticmethod
+    def iter_ids(bits):
+        """Ids of the set bits in increasing order (= position in words_dict[length])."""
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+
+def _candidates(index, slots, constraints, assignment, slot_idx, revealed=None):
+    """
+    Words for slot_idx that agree with every crossing slot already assigned
+    (and with the slot's revealed letters, see GridSlots.fixed).
+    """
+    length = len(slots[slot_idx])
+    fixed = [(i1, assignment[other][i2])
+             for (other, i1, i2) in constraints.get(slot_idx, []) if other in assignment]
+    if revealed is not None:
+        fixed.extend(revealed[slot_idx])
+    return index.iter_words(length, index.compatible(length, fixed))
+
+
+def backtrack(slots, words_dict, constraints, assignment=None, used=None, slot_idx=0, index=None,
+              revealed=None):
     if assignment is None:
         assignment = {}
     if used is None:
         used = set()
+    if index is None:
+        index = PositionIndex(words_dict)
 
     if slot_idx == len(slots):
         return assignment  # all slots filled
 
-    slot = slots[slot_idx]
-    length = len(slot)
-    candidates = words_dict.get(length, [])
-
-    for word in candidates:
+    for word in _candidates(index, slots, constraints, assignment, slot_idx, revealed):
         if word in used:
             continue
 
-        # Check constraints with already assigned slots
-        ok = True
-        for (other, i1, i2) in constraints.get(slot_idx, []):
-            if other in assignment:
-                if assignment[other][i2] != word[i1]:
-                    ok = False
-                    break
-        if not ok:
-            continue
-
         # Assign word
         assignment[slot_idx] = word
         used.add(word)
 
-        result = backtrack(slots, words_dict, constraints, assignment, used, slot_idx + 1)
+        result = backtrack(slots, words_dict, constraints, assignment, used, slot_idx + 1, index, revealed)
         if result:
             return result
 
@@ -93,60 +291,785 @@ def backtrack(slots, words_dict, constraints, assignment=None, used=None, slot_i
     return None
 
 
-def solve_crossword(matrix, words_dict):
-    slots = find_word_slots(matrix)
-    constraints = build_constraints(slots)
-    return backtrack(slots, words_dict, constraints)
+def solve_crossword(matrix, words_dict, strategy="mrv"):
+    grid = grid_slots(matrix)
+    slots, constraints = grid.slots, grid.constraints
+    words_dict = grid.with_revealed(words_dict)
+    index = PositionIndex(words_dict)
+    if strategy == "mrv":
+        return next(search_mrv(slots, words_dict, constraints, index, grid.domains(index)), None)
+    if strategy == "ordered":
+        return backtrack(slots, words_dict, constraints, index=index, revealed=grid.fixed)
+    raise ValueError(f"Unknown strategy: {strategy!r}")
 
 
-def backtrack_all(slots, words_dict, constraints, assignment=None, used=None, slot_idx=0, solutions=None):
+def iter_backtrack(slots, words_dict, constraints, assignment=None, used=None, slot_idx=0, index=None,
+                   stop=None, revealed=None):
+    """
+    Yield every solution, filling slots in their fixed order (stop: see
+    search_mrv, revealed: per-slot revealed letters as in GridSlots.fixed).
+    """
     if assignment is None:
         assignment = {}
     if used is None:
         used = set()
-    if solutions is None:
-        solutions = []
+    if index is None:
+        index = PositionIndex(words_dict)
 
+    if stop is not None and stop():
+        return
     if slot_idx == len(slots):
         # Found full solution
-        solutions.append(assignment.copy())
-        return solutions
-
-    slot = slots[slot_idx]
-    length = len(slot)
-    candidates = words_dict.get(length, [])
+        yield assignment.copy()
+        return
 
-    for word in candidates:
+    for word in _candidates(index, slots, constraints, assignment, slot_idx, revealed):
         if word in used:
             continue
 
-        # Check constraints
-        ok = True
-        for (other, i1, i2) in constraints.get(slot_idx, []):
-            if other in assignment:
-                if assignment[other][i2] != word[i1]:
-                    ok = False
-                    break
-        if not ok:
-            continue
-
         # Assign
         assignment[slot_idx] = word
         used.add(word)
 
-        backtrack_all(slots, words_dict, constraints, assignment, used, slot_idx + 1, solutions)
+        yield from iter_backtrack(slots, words_dict, constraints, assignment, used, slot_idx + 1, index, stop,
+                                  revealed)
 
         # Undo
         del assignment[slot_idx]
         used.remove(word)
 
+
+def backtrack_all(slots, words_dict, constraints, assignment=None, used=None, slot_idx=0, solutions=None,
+                  index=None):
+    if solutions is None:
+        solutions = []
+    solutions.extend(iter_backtrack(slots, words_dict, constraints, assignment, used, slot_idx, index))
     return solutions
 
 
-def solve_crossword_all(matrix, words_dict):
-    slots = find_word_slots(matrix)
-    constraints = build_constraints(slots)
-    return backtrack_all(slots, words_dict, constraints)
+def search_mrv(slots, words_dict, constraints, index=None, domains=None, stop=None):
+    """
+    Yield every solution, filling the slot with the fewest remaining candidates
+    first (MRV) and pruning the domains of crossing slots after each assignment
+    (forward checking). Finds the same solutions as backtrack_all.
+    Domains are PositionIndex bitsets, so pruning is a single AND; pass
+    `domains` to start from narrowed ones.
+    `stop` is called once per visited node; once it returns True the search
+    unwinds without yielding anything else.
+
+    The search runs as an explicit-stack loop over integer word ids: the
+    assignment is a fixed-size array, used words are a bitset of global word
+    ids, and domain changes are undone from a trail instead of copying the
+    domains at every node.
+    """
+    if index is None:
+        index = PositionIndex(words_dict)
+    n = len(slots)
+    lengths = [len(slot) for slot in slots]
+    if domains is None:
+        domains = [index.full.get(length, 0) for length in lengths]
+    domains = list(domains)
+    links = [constraints.get(i, []) for i in range(n)]
+    letter_bits = [index.letter_bits.get(length, [[]] * length) for length in lengths]
+    codes = [index.codes.get(length) for length in lengths]
+    gids = [index.gids.get(length) for length in lengths]
+    same_ids = [index.same_ids.get(length) for length in lengths]
+
+    assignment = array("l", [-1]) * n
+    used = 0
+    trail = []   # (slot, domain before pruning)
+    slot_range = range(n)
+
+    def pick():
+        best, best_count = -1, -1
+        for i in slot_range:
+            if assignment[i] < 0:
+                count = domains[i].bit_count()
+                if best < 0 or count < best_count:
+                    best, best_count = i, count
+        return best
+
+    def solution():
+        return {i: index.words[lengths[i]][assignment[i]] for i in slot_range}
+
+    if stop is not None and stop():
+        return
+    slot_idx = pick()
+    if slot_idx < 0:
+        yield solution()
+        return
+
+    # Frame: [slot, candidate ids not tried yet, trail length on entry]
+    stack = [[slot_idx, domains[slot_idx], 0]]
+    while stack:
+        frame = stack[-1]
+        slot_idx = frame[0]
+        word_id = assignment[slot_idx]
+        if word_id >= 0:
+            # Undo the previous candidate of this frame
+            used &= ~(1 << gids[slot_idx][word_id])
+            assignment[slot_idx] = -1
+            while len(trail) > frame[2]:
+                other, domain = trail.pop()
+                domains[other] = domain
+
+        remaining = frame[1]
+        if not remaining:
+            stack.pop()
+            continue
+        low = remaining & -remaining
+        frame[1] = remaining ^ low
+        word_id = low.bit_length() - 1
+        gid = gids[slot_idx][word_id]
+        if used >> gid & 1:
+            continue
+
+        # Forward checking: keep only crossing words that agree with this one
+        length = lengths[slot_idx]
+        row = word_id * length
+        word_codes = codes[slot_idx]
+        ok = True
+        for (other, i1, i2) in links[slot_idx]:
+            if assignment[other] >= 0:
+                continue
+            old = domains[other]
+            domain = old & letter_bits[other][i2][word_codes[row + i1]]
+            if lengths[other] == length:
+                domain &= ~same_ids[slot_idx][word_id]
+            if not domain:
+                ok = False
+                break
+            if domain != old:
+                trail.append((other, old))
+                domains[other] = domain
+        if not ok:
+            while len(trail) > frame[2]:
+                other, domain = trail.pop()
+                domains[other] = domain
+            continue
+
+        assignment[slot_idx] = word_id
+        used |= 1 << gid
+        if stop is not None and stop():
+            return
+        next_slot = pick()
+        if next_slot < 0:
+            yield solution()
+        else:
+            stack.append([next_slot, domains[next_slot], len(trail)])
+
+
+class SolveBudget:
+    """
+    Wall-clock and/or visited-node budget for a solve. The clock starts when
+    the budget is created. Instances are `stop` callables for search_mrv;
+    `exhausted` tells afterwards whether the search was cut short.
+    """
+
+    def __init__(self, time_limit=None, max_nodes=None):
+        self.deadline = None if time_limit is None else time.monotonic() + time_limit
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.exhausted = False
+
+    def __call__(self):
+        if not self.exhausted:
+            self.nodes += 1
+            if self.max_nodes is not None and self.nodes > self.max_nodes:
+                self.exhausted = True
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.exhausted = True
+        return self.exhausted
+
+
+class SolveResult:
+    """Outcome of solve_crossword_anytime: what was found and whether the search finished."""
+
+    def __init__(self, solutions, slot_words, complete):
+        self.solutions = solutions
+        self.slot_words = slot_words
+        self.complete = complete
+
+
+class SolveCancelled(Exception):
+    """Raised when a parallel solve is abandoned through its cancel event."""
+
+
+def event_stop(event, every=256):
+    """
+    A `stop` callable for search_mrv that polls event every `every` nodes
+    and keeps returning True once it has been set.
+    """
+    count = 0
+    stopped = False
+
+    def stop():
+        nonlocal count, stopped
+        if not stopped:
+            count += 1
+            stopped = count % every == 0 and event.is_set()
+        return stopped
+
+    return stop
+
+
+def _split_domains(slots, constraints, index, domains, depth):
+    """
+    Split the search into disjoint subtrees by fixing the MRV slot to each of
+    its words (recursively, `depth` levels deep). Returns the domain vectors
+    the subtrees start from; each one is searched with search_mrv.
+    """
+    if depth == 0:
+        return [domains]
+    lengths = [len(slot) for slot in slots]
+    open_slots = [i for i in range(len(slots)) if domains[i].bit_count() > 1]
+    if not open_slots:
+        return [domains]
+
+    slot_idx = min(open_slots, key=lambda i: domains[i].bit_count())
+    length = lengths[slot_idx]
+    tasks = []
+    remaining = domains[slot_idx]
+    while remaining:
+        low = remaining & -remaining
+        word = index.words[length][low.bit_length() - 1]
+        word_ids = index.same_word(length, word) & domains[slot_idx]
+        remaining &= ~word_ids
+
+        fixed = list(domains)
+        fixed[slot_idx] = word_ids
+        for (other, i1, i2) in constraints.get(slot_idx, []):
+            fixed[other] &= index.with_letter(lengths[other], i2, word[i1]) & ~index.same_word(lengths[other], word)
+        if all(fixed):
+            tasks.extend(_split_domains(slots, constraints, index, fixed, depth - 1))
+    return tasks
+
+
+# Per-process state of parallel solve workers, set by _init_worker
+_worker = {}
+
+
+def _init_worker(cancel_event, slots, constraints, words_dict):
+    _worker["cancel_event"] = cancel_event
+    _worker["slots"] = slots
+    _worker["constraints"] = constraints
+    _worker["words_dict"] = words_dict
+    _worker["index"] = PositionIndex(words_dict)
+
+
+def _solve_subtree(domains):
+    """Worker task: all solutions of one subtree, or None if cancelled."""
+    stop = event_stop(_worker["cancel_event"])
+    solutions = list(search_mrv(_worker["slots"], _worker["words_dict"], _worker["constraints"],
+                                _worker["index"], domains, stop))
+    return None if stop() else solutions
+
+
+def _default_mp_context():
+    # Not fork: the bot has threads running (OCR monitor, telegram), and a
+    # forked child inherits their locks in whatever state they were in
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def solve_crossword_parallel(matrix, words_dict, workers=None, split_depth=1, cancel_event=None,
+                             mp_context=None):
+    """
+    All solutions for the grid, searched on a process pool. The search tree
+    is split at the first `split_depth` branching levels, the subtrees are
+    solved by `workers` processes (default: all CPUs) and the results are
+    merged in subtree order.
+
+    cancel_event is a multiprocessing.Event shared with the workers; setting
+    it (e.g. from another thread) abandons the solve with SolveCancelled.
+    mp_context is the multiprocessing context of the pool (default:
+    forkserver, or spawn where that is not available); a cancel_event passed
+    in should come from the same context.
+    """
+    grid = grid_slots(matrix)
+    slots, constraints = grid.slots, grid.constraints
+    words_dict = grid.with_revealed(words_dict)
+    index = PositionIndex(words_dict)
+    domains = grid.domains(index)
+    if not all(domains):
+        return []
+    tasks = _split_domains(slots, constraints, index, domains, split_depth)
+
+    ctx = mp_context or _default_mp_context()
+    if cancel_event is None:
+        cancel_event = ctx.Event()
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(cancel_event, slots, constraints, words_dict),
+    ) as pool:
+        futures = [pool.submit(_solve_subtree, task) for task in tasks]
+        solutions = []
+        for future in futures:
+            part = future.result()
+            if part is None or cancel_event.is_set():
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise SolveCancelled()
+            solutions.extend(part)
+    return solutions
+
+
+def slot_components(n_slots, constraints):
+    """Connected components of the slot crossing graph, as sorted lists of slot indices."""
+    seen = set()
+    components = []
+    for start in range(n_slots):
+        if start in seen:
+            continue
+        seen.add(start)
+        component = [start]
+        queue = deque([start])
+        while queue:
+            slot_idx = queue.popleft()
+            for (other, _, _) in constraints.get(slot_idx, []):
+                if other not in seen:
+                    seen.add(other)
+                    component.append(other)
+                    queue.append(other)
+        components.append(sorted(component))
+    return components
+
+
+class ComponentSolutions:
+    """
+    Solutions of one independent group of crossing slots, as partial
+    {slot index: word} dicts. A grid's solutions are the product of its
+    components' solutions, minus combinations that reuse a word.
+    """
+
+    def __init__(self, slots, solutions):
+        self.slots = slots
+        self.solutions = solutions
+        self.word_sets = [frozenset(solution.values()) for solution in solutions]
+
+    def items(self):
+        """(solution, word set) pairs."""
+        return zip(self.solutions, self.word_sets)
+
+
+class LazyComponentSolutions(ComponentSolutions):
+    """
+    ComponentSolutions filled from a running search only as far as they are
+    walked, so combining components does not enumerate each one up front.
+    """
+
+    def __init__(self, slots, search):
+        super().__init__(slots, [])
+        self._search = search
+
+    def _pull(self):
+        if self._search is not None:
+            solution = next(self._search, None)
+            if solution is not None:
+                self.solutions.append(solution)
+                self.word_sets.append(frozenset(solution.values()))
+                return True
+            self._search = None
+        return False
+
+    def items(self):
+        i = 0
+        while i < len(self.solutions) or self._pull():
+            yield self.solutions[i], self.word_sets[i]
+            i += 1
+
+    def any(self):
+        """Whether the component has a solution (searches for the first one)."""
+        return bool(self.solutions) or self._pull()
+
+
+def _subgrid(slots, constraints, component):
+    """Slots and constraints of a component, renumbered from 0 in component order."""
+    local = {slot_idx: i for i, slot_idx in enumerate(component)}
+    sub_slots = [slots[slot_idx] for slot_idx in component]
+    sub_constraints = {
+        local[slot_idx]: [(local[other], i1, i2) for (other, i1, i2) in constraints[slot_idx]]
+        for slot_idx in component if slot_idx in constraints
+    }
+    return sub_slots, sub_constraints
+
+
+def _search_component(slots, constraints, words_dict, index, component, stop=None, domains=None):
+    """Yield the solutions of one component, keyed by the original slot indices."""
+    sub_slots, sub_constraints = _subgrid(slots, constraints, component)
+    if domains is not None:
+        domains = [domains[slot_idx] for slot_idx in component]
+    for solution in search_mrv(sub_slots, words_dict, sub_constraints, index, domains, stop):
+        yield {component[i]: word for i, word in solution.items()}
+
+
+def _solve_component(slots, constraints, words_dict, index, component, stop=None, domains=None):
+    """All solutions of one component, keyed by the original slot indices."""
+    solutions = list(_search_component(slots, constraints, words_dict, index, component, stop, domains))
+    return ComponentSolutions(component, solutions)
+
+
+def solve_components(matrix, words_dict, budget=None):
+    """
+    Solve each connected component of the grid on its own and return the
+    results in product form (a list of ComponentSolutions). Independent parts
+    of a grid then cost the sum of their search times, not the product.
+    Use combine_components to expand them into full solutions.
+    """
+    grid = grid_slots(matrix)
+    words_dict = grid.with_revealed(words_dict)
+    index = PositionIndex(words_dict)
+    domains = grid.domains(index)
+    result = []
+    for component in slot_components(len(grid.slots), grid.constraints):
+        solved = _solve_component(grid.slots, grid.constraints, words_dict, index, component, budget, domains)
+        result.append(solved)
+        if not solved.solutions:
+            break  # one unsolvable part means no solution at all
+    return result
+
+
+def combine_components(components, base=None):
+    """
+    Yield full solutions from product form. The only rule shared between
+    components is that a word is used once, checked with a set intersection.
+    `base` is a partial solution of other slots merged into every result.
+    """
+    n = len(components)
+    chosen = [] if base is None else [base]
+
+    def walk(i, used):
+        if i == n:
+            merged = {}
+            for solution in chosen:
+                merged.update(solution)
+            yield {slot_idx: merged[slot_idx] for slot_idx in sorted(merged)}
+            return
+        component = components[i]
+        for solution, words in component.items():
+            if used.isdisjoint(words):
+                chosen.append(solution)
+                yield from walk(i + 1, used | words)
+                chosen.pop()
+
+    yield from walk(0, frozenset() if base is None else frozenset(base.values()))
+
+
+def _iter_component_solutions(slots, constraints, words_dict, components, stop=None, index=None, domains=None):
+    """
+    Yield full solutions component by component: the first component is
+    searched live, the others lazily as the combinations reach them, so
+    stopping early does not pay for enumerating every component.
+    """
+    if index is None:
+        index = PositionIndex(words_dict)
+    rest = [
+        LazyComponentSolutions(component,
+                               _search_component(slots, constraints, words_dict, index, component, stop, domains))
+        for component in components[1:]
+    ]
+    if not all(part.any() for part in rest):
+        return  # one unsolvable part means no solution at all
+    for solution in _search_component(slots, constraints, words_dict, index, components[0], stop, domains):
+        yield from combine_components(rest, solution)
+
+
+def arc_consistent(slots, constraints, index, domains):
+    """
+    AC-3 over bitset domains: drop every word that has no matching letter in
+    some crossing slot's domain. Returns the narrowed domains, or None if a
+    domain becomes empty (the grid has no solution).
+    """
+    lengths = [len(slot) for slot in slots]
+    domains = list(domains)
+    if any(not domain for domain in domains):
+        return None
+
+    queue = deque((s, t, i1, i2) for s, links in constraints.items() for (t, i1, i2) in links)
+    queued = set(queue)
+    while queue:
+        arc = queue.popleft()
+        queued.discard(arc)
+        s, t, i1, i2 = arc
+
+        allowed = 0
+        for letter, bits in index.letters_at(lengths[t], i2):
+            if domains[t] & bits:
+                allowed |= index.with_letter(lengths[s], i1, letter)
+        narrowed = domains[s] & allowed
+        if narrowed == domains[s]:
+            continue
+        if not narrowed:
+            return None
+        domains[s] = narrowed
+        for (u, j1, j2) in constraints.get(s, []):
+            if u != t and (u, s, j2, j1) not in queued:
+                queue.append((u, s, j2, j1))
+                queued.add((u, s, j2, j1))
+    return domains
+
+
+def _feasible_words(slots, constraints, words_dict, index, budget=None, domains=None):
+    """Witness search behind feasible_slot_words for one (sub)grid."""
+    lengths = [len(slot) for slot in slots]
+
+    if domains is None:
+        domains = [index.full.get(length, 0) for length in lengths]
+    domains = arc_consistent(slots, constraints, index, domains)
+    if domains is None:
+        return None
+
+    supported = [0] * len(slots)
+    for slot_idx in sorted(range(len(slots)), key=lambda i: domains[i].bit_count()):
+        length = lengths[slot_idx]
+        remaining = domains[slot_idx] & ~supported[slot_idx]
+        while remaining:
+            low = remaining & -remaining
+            word = index.words[length][low.bit_length() - 1]
+            word_ids = index.same_word(length, word) & domains[slot_idx]
+
+            trial = list(domains)
+            trial[slot_idx] = word_ids
+            witness = next(search_mrv(slots, words_dict, constraints, index, trial, budget), None)
+            if witness is not None:
+                for other, other_word in witness.items():
+                    supported[other] |= index.same_word(lengths[other], other_word) & domains[other]
+            elif budget is not None and budget.exhausted:
+                break  # out of budget: keep what has been proven so far
+            remaining &= ~word_ids & ~supported[slot_idx]
+
+        if budget is not None and budget.exhausted:
+            break
+        if not supported[slot_idx]:
+            return None
+
+    return {i: set(index.iter_words(lengths[i], supported[i])) for i in range(len(slots))}
+
+
+class SolverSession:
+    """
+    One grid solved for changing letters (e.g. when the user corrects the
+    letters the OCR found). Slots, constraints and components are built once;
+    set_words then rebuilds only the PositionIndex entries and slot domains
+    of the word lengths whose word list changed, and an unchanged word list
+    reuses the previous feasible_slot_words result.
+    """
+
+    def __init__(self, matrix, words_dict=None):
+        self.grid = grid_slots(matrix)
+        self.components = slot_components(len(self.grid.slots), self.grid.constraints)
+        self.lengths = sorted({len(slot) for slot in self.grid.slots})
+        self.words_dict = {}
+        self.index = PositionIndex({})
+        self.domains = [0] * len(self.grid.slots)
+        self._feasible = None
+        if words_dict is not None:
+            self.set_words(words_dict)
+
+    def set_words(self, words_dict):
+        """Switch to a new words_dict; returns the word lengths that changed."""
+        grid = self.grid
+        words_dict = grid.with_revealed({length: list(words_dict.get(length, ())) for length in self.lengths})
+        changed = [length for length in self.lengths if words_dict[length] != self.words_dict.get(length)]
+        if not changed:
+            return changed
+        for length in changed:
+            self.index.set_words(length, words_dict[length])
+        self.words_dict = words_dict
+        changed_lengths = set(changed)
+        for i, (slot, fixed) in enumerate(zip(grid.slots, grid.fixed)):
+            if len(slot) in changed_lengths:
+                self.domains[i] = self.index.compatible(len(slot), fixed)
+        self._feasible = None
+        return changed
+
+    def iter_solutions(self, max_solutions=None, budget=None):
+        """Solutions for the current words (see iter_solutions, strategy="mrv")."""
+        grid = self.grid
+        if len(self.components) > 1:
+            solutions = _iter_component_solutions(grid.slots, grid.constraints, self.words_dict, self.components,
+                                                  budget, self.index, self.domains)
+        else:
+            solutions = search_mrv(grid.slots, self.words_dict, grid.constraints, self.index, self.domains, budget)
+        if max_solutions is not None:
+            solutions = islice(solutions, max_solutions)
+        return solutions
+
+    def feasible_slot_words(self, budget=None):
+        """Feasible words per slot for the current words (see feasible_slot_words)."""
+        if self._feasible is not None:
+            return self._feasible[0]
+        result = self._solve_feasible(budget)
+        if budget is None or not budget.exhausted:
+            self._feasible = (result,)
+        return result
+
+    def _solve_feasible(self, budget):
+        grid = self.grid
+        slots, constraints = grid.slots, grid.constraints
+        words_dict, index, domains = self.words_dict, self.index, self.domains
+        if len(self.components) <= 1:
+            return _feasible_words(slots, constraints, words_dict, index, budget, domains)
+
+        result = {}
+        owner = {}
+        for n, component in enumerate(self.components):
+            sub_slots, sub_constraints = _subgrid(slots, constraints, component)
+            sub_domains = [domains[slot_idx] for slot_idx in component]
+            part = _feasible_words(sub_slots, sub_constraints, words_dict, index, budget, sub_domains)
+            if part is None:
+                return None
+            for i, words in part.items():
+                for word in words:
+                    if owner.setdefault(word, n) != n and not (budget is not None and budget.exhausted):
+                        return _feasible_words(slots, constraints, words_dict, index, budget, domains)
+                result[component[i]] = words
+        return {i: result[i] for i in range(len(slots))}
+
+
+def feasible_slot_words(matrix, words_dict, budget=None):
+    """
+    For every slot, the set of words that appear in at least one full solution
+    ({slot index: set of words}), or None if the grid has no solution.
+    With a SolveBudget that runs out, the sets found so far are returned
+    (possibly empty, but every word in them is part of a real solution)
+    and budget.exhausted is set.
+
+    Instead of enumerating all solutions, each (slot, word) pair only needs one
+    witness solution; every witness found also supports all the other words it
+    uses, so the number of searches is bounded by the number of distinct words.
+    Independent parts of the grid are handled separately; if two parts can use
+    the same word, the whole grid is searched at once to respect uniqueness.
+    """
+    return SolverSession(matrix, words_dict).feasible_slot_words(budget)
+
+
+def _lowest_id(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+def search_best_first(slots, words_dict, constraints, index=None, beam_width=None, stop=None, domains=None):
+    """
+    Yield (score, solution) pairs in order of increasing score, where the score
+    is the summed rank of the words (their position in words_dict[length],
+    which is sorted by frequency), so the most likely fills come first.
+
+    A* over partial assignments: a partial fill is scored by its words' ranks
+    plus, for every open slot, the best rank still left in its domain, which
+    never overestimates. Slots are expanded in MRV order with forward checking.
+    beam_width caps the frontier (faster, but then the order is approximate).
+    `domains` are the starting domains, as in search_mrv.
+    """
+    if index is None:
+        index = PositionIndex(words_dict)
+    n = len(slots)
+    lengths = [len(slot) for slot in slots]
+    if domains is None:
+        domains = [index.full.get(length, 0) for length in lengths]
+    if n and not all(domains):
+        return
+
+    counter = 0
+    heap = [(sum(_lowest_id(d) for d in domains), 0, counter, tuple(domains), ())]
+    while heap:
+        if stop is not None and stop():
+            return
+        _, score, _, domains, assigned = heapq.heappop(heap)
+        if len(assigned) == n:
+            yield score, dict(sorted(assigned))
+            continue
+
+        assigned_slots = {slot_idx for slot_idx, _ in assigned}
+        used = {word for _, word in assigned}
+        open_slots = [i for i in range(n) if i not in assigned_slots]
+        slot_idx = min(open_slots, key=lambda i: domains[i].bit_count())
+        neighbours = [(other, i1, i2) for (other, i1, i2) in constraints.get(slot_idx, [])
+                      if other not in assigned_slots]
+        length = lengths[slot_idx]
+
+        for word_id in index.iter_ids(domains[slot_idx]):
+            word = index.words[length][word_id]
+            if word in used:
+                continue
+
+            new_domains = list(domains)
+            new_domains[slot_idx] = 1 << word_id
+            for (other, i1, i2) in neighbours:
+                other_length = lengths[other]
+                new_domains[other] &= (index.with_letter(other_length, i2, word[i1])
+                                       & ~index.same_word(other_length, word))
+                if not new_domains[other]:
+                    break
+            else:
+                new_score = score + word_id
+                bound = new_score + sum(_lowest_id(new_domains[i]) for i in open_slots if i != slot_idx)
+                counter += 1
+                heapq.heappush(heap, (bound, new_score, counter, tuple(new_domains),
+                                      assigned + ((slot_idx, word),)))
+
+        if beam_width is not None and len(heap) > beam_width:
+            heap = heapq.nsmallest(beam_width, heap)
+            heapq.heapify(heap)
+
+
+def solve_crossword_top_k(matrix, words_dict, k=1, beam_width=None, budget=None):
+    """
+    The k most likely solutions (lowest summed word rank first) as a list of
+    (score, solution) pairs, without enumerating every solution.
+    """
+    grid = grid_slots(matrix)
+    words_dict = grid.with_revealed(words_dict)
+    index = PositionIndex(words_dict)
+    best = search_best_first(grid.slots, words_dict, grid.constraints, index,
+                             beam_width=beam_width, stop=budget, domains=grid.domains(index))
+    return list(islice(best, k))
+
+
+def iter_solutions(matrix, words_dict, strategy="mrv", max_solutions=None, budget=None):
+    """
+    Lazily yield solutions for the grid ({slot index: word} dicts).
+    strategy="mrv" uses search_mrv (on each independent part of the grid
+    separately, see solve_components), "ordered" the plain slot-order backtracking.
+    The search stops after max_solutions solutions, when the SolveBudget
+    runs out, or as soon as the caller stops iterating. Only the partial
+    solutions of the grid's other parts reached so far are kept (none for a
+    grid in one part).
+    """
+    if strategy == "mrv":
+        solutions = SolverSession(matrix, words_dict).iter_solutions(budget=budget)
+    elif strategy == "ordered":
+        grid = grid_slots(matrix)
+        words_dict = grid.with_revealed(words_dict)
+        solutions = iter_backtrack(grid.slots, words_dict, grid.constraints, stop=budget, revealed=grid.fixed)
+    else:
+        raise ValueError(f"Unknown strategy: {strategy!r}")
+    if max_solutions is not None:
+        solutions = islice(solutions, max_solutions)
+    return solutions
+
+
+def solve_crossword_all(matrix, words_dict, strategy="mrv", max_solutions=None, budget=None):
+    """
+    All solutions for the grid as a list (see iter_solutions). With a
+    SolveBudget the list holds what was found before it ran out.
+    """
+    return list(iter_solutions(matrix, words_dict, strategy, max_solutions, budget))
+
+
+def solve_crossword_anytime(matrix, words_dict, budget, strategy="mrv", max_solutions=None):
+    """
+    Budgeted solve that always returns within the budget: the solutions found
+    so far, the per-slot words they use, and whether the search completed.
+    """
+    solutions = solve_crossword_all(matrix, words_dict, strategy, max_solutions, budget)
+    slot_words = {}
+    for solution in solutions:
+        for slot_idx, word in solution.items():
+            slot_words.setdefault(slot_idx, set()).add(word)
+    complete = not budget.exhausted and (max_solutions is None or len(solutions) < max_solutions)
+    return SolveResult(solutions, slot_words, complete)
 
 
 if __name__ == "__main__":
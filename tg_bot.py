@@ -1,6 +1,5 @@
 import logging
 import os
-import shutil
 import io
 from datetime import datetime
 
@@ -16,9 +15,12 @@ from telegram.ext import (
 )
 
 # --- Import your custom modules ---
-from crossword import extract_crossword_grid, matrix_to_crossword_image
-from letters import extract_cyrillic_letters
-from solver import solve_crossword_all
+from artifacts import MODES as ARTIFACT_MODES, MemoryRecorder, make_recorder
+from crossword import GRID_ENGINES, extract_crossword_grid, matrix_to_crossword_image
+from layout import detect_layout
+from letters import decode_image, extract_cyrillic_letters
+from ocr_pool import get_ocr_pool
+from solver import SolveBudget, SolverSession
 from words import get_words_data
 
 # --- Setup logging ---
@@ -27,13 +29,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Wall-clock budget (seconds) for one crossword solve, so a bad grid can't stall the bot.
+SOLVE_TIME_LIMIT = float(os.getenv("SOLVE_TIME_LIMIT", "10"))
+
+# Grid detection engine, see crossword.GRID_ENGINES ("python crossword.py --compare DIR" compares them)
+GRID_ENGINE = os.getenv("GRID_ENGINE", "contours")
+if GRID_ENGINE not in GRID_ENGINES:
+    raise ValueError(f"GRID_ENGINE must be one of {GRID_ENGINES}, got {GRID_ENGINE!r}")
+
+# Extractor debug images: "off", "memory" (kept per request, written to ./bad with
+# a flagged screenshot) or "files" (every request written to ./debug).
+DEBUG_ARTIFACTS = os.getenv("DEBUG_ARTIFACTS", "off")
+if DEBUG_ARTIFACTS not in ARTIFACT_MODES:
+    raise ValueError(f"DEBUG_ARTIFACTS must be one of {ARTIFACT_MODES}, got {DEBUG_ARTIFACTS!r}")
+
 # --- Conversation States ---
 (
     AWAITING_IMAGE,
     GRID_CONFIRMATION,
     LETTERS_CONFIRMATION,
     AWAITING_CORRECTED_LETTERS,
-) = range(4)
+    SOLVED,
+) = range(5)
 
 
 # --- Helper Functions ---
@@ -44,23 +61,28 @@ async def save_bad_screenshot(context: ContextTypes.DEFAULT_TYPE):
 
     user = context.user_data.get("user")
     date_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    original_path = context.user_data.get("screenshot_path")
+    screenshot_bytes = context.user_data.get("screenshot_bytes")
 
-    if user and original_path and os.path.exists(original_path):
+    if user and screenshot_bytes:
         destination_path = f"./bad/{date_str}_{user.id}_{user.username}.png"
-        # Using copyfile so the original temp file can still be cleaned up normally
-        shutil.copyfile(original_path, destination_path)
+        # The photo as downloaded, this is the only place it touches the disk
+        with open(destination_path, "wb") as f:
+            f.write(screenshot_bytes)
         logger.info(f"Saved bad screenshot to {destination_path}")
+        recorder = context.user_data.get("artifacts")
+        if isinstance(recorder, MemoryRecorder):
+            paths = recorder.save("./bad", prefix=f"{date_str}_{user.id}_")
+            logger.info(f"Saved {len(paths)} debug images next to it")
         return destination_path
     return None
 
 
-def cleanup_temp_file(context: ContextTypes.DEFAULT_TYPE):
-    """Deletes the temporary screenshot file."""
-    temp_path = context.user_data.get("screenshot_path")
-    if temp_path and os.path.exists(temp_path):
-        os.remove(temp_path)
-        logger.info(f"Cleaned up temp file: {temp_path}")
+def release_screenshot(context: ContextTypes.DEFAULT_TYPE):
+    """Drops the downloaded screenshot (raw bytes, decoded image, debug images) from user_data."""
+    context.user_data.pop("screenshot_bytes", None)
+    context.user_data.pop("screenshot", None)
+    context.user_data.pop("artifacts", None)
+    context.user_data.pop("layout", None)
 
 # --- Formatting Helpers ---
 def format_words_output(words_data: dict) -> str:
@@ -71,17 +93,74 @@ def format_words_output(words_data: dict) -> str:
         response_text += f"**{size}):** {words_preview}\n"
     return response_text
 
-def format_solution_output(solution: list, weights: dict, custom_letters: bool = False) -> str:
-    """Formats the crossword solution for display."""
-    title = "✨ Solution (with your letters) ✨" if custom_letters else "✨ Crossword Solution ✨"
+def format_feasible_output(slot_words: dict, weights: dict, custom_letters: bool = False) -> str:
+    """Formats the per-slot feasible words (see solver.feasible_slot_words) for display."""
     res = dict()
-    for sol in solution:
-        for _, word in sol.items():
-            idx = len(word)
-            if idx not in res:
-                res[idx] = []
-            res[idx].append(word)
-    solution_lines = [', '.join(sorted(list(set(words)), key=lambda w: weights[w])) for ind, words in res.items()]
+    for _, words in slot_words.items():
+        for word in words:
+            res.setdefault(len(word), set()).add(word)
+    return _format_solution_words(res, weights, custom_letters)
+
+
+def without_revealed(matrix):
+    """The grid with its revealed letters turned back into empty cells."""
+    return [[1 if isinstance(value, str) else value for value in row] for row in matrix]
+
+
+def get_solver_session(context: ContextTypes.DEFAULT_TYPE, revealed: bool = True) -> SolverSession:
+    """
+    The solver session for the user's grid (or for the grid without its
+    revealed letters), kept in user_data so letter corrections re-solve incrementally.
+    """
+    key = "solver_session" if revealed else "solver_session_plain"
+    session = context.user_data.get(key)
+    if session is None:
+        matrix = context.user_data["matrix"]
+        session = SolverSession(matrix if revealed else without_revealed(matrix))
+        context.user_data[key] = session
+    return session
+
+
+def _solve_session(session: SolverSession, words: dict, budget: SolveBudget):
+    changed = session.set_words(words)
+    logger.info(f"Solver session: word lengths {changed} changed")
+    return session.feasible_slot_words(budget=budget)
+
+
+def solve_grid_words(context: ContextTypes.DEFAULT_TYPE, words: dict):
+    """
+    Feasible words per slot within SOLVE_TIME_LIMIT; returns (slot_words, complete).
+    A revealed letter the OCR misread makes the grid unsolvable, so when there
+    is no solution with them the grid is solved again without them.
+    """
+    budget = SolveBudget(time_limit=SOLVE_TIME_LIMIT)
+    slot_words = _solve_session(get_solver_session(context), words, budget)
+    matrix = context.user_data["matrix"]
+    if slot_words is None and not budget.exhausted and without_revealed(matrix) != matrix:
+        logger.info("No solution with the revealed letters, solving without them")
+        slot_words = _solve_session(get_solver_session(context, revealed=False), words, budget)
+    if budget.exhausted:
+        logger.warning(f"Solve stopped after {SOLVE_TIME_LIMIT}s ({budget.nodes} nodes)")
+        if slot_words is not None and not any(slot_words.values()):
+            slot_words = None
+    return slot_words, not budget.exhausted
+
+
+def solution_keyboard() -> InlineKeyboardMarkup:
+    """Buttons under a solution: the plain word list, or correcting the letters and solving again."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🔤 Show possible words instead", callback_data="show_words_fallback")],
+        [InlineKeyboardButton("✍️ Wrong letters", callback_data="fix_letters")],
+    ])
+
+
+PARTIAL_NOTE = "\n\n⏱ Search stopped early, some words may be missing."
+
+
+def _format_solution_words(res: dict, weights: dict, custom_letters: bool) -> str:
+    title = "✨ Solution (with your letters) ✨" if custom_letters else "✨ Crossword Solution ✨"
+    # Revealed words missing from the dictionary have no weight and go last
+    solution_lines = [', '.join(sorted(words, key=lambda w: weights.get(w, len(weights)))) for ind, words in res.items()]
     return f"{title}\n\n" + "\n".join(solution_lines)
 
 
@@ -97,7 +176,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancels and ends the conversation."""
     await update.message.reply_text("Operation cancelled.")
-    cleanup_temp_file(context)
+    release_screenshot(context)
     return ConversationHandler.END
 
 
@@ -111,16 +190,29 @@ async def image_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
     context.user_data["user"] = update.effective_user
 
-    if not os.path.exists("./temp"):
-        os.makedirs("./temp")
-    screenshot_path = f"./temp/{photo_file.file_id}.png"
-    await photo_file.download_to_drive(screenshot_path)
-    context.user_data["screenshot_path"] = screenshot_path
+    # Download into memory and decode once; the grid and letter stages share the image
+    buffer = io.BytesIO()
+    await photo_file.download_to_memory(buffer)
+    screenshot_bytes = buffer.getvalue()
+    screenshot = decode_image(screenshot_bytes)
+    if screenshot is None:
+        await update.message.reply_text("Sorry, I couldn't read that image. Please send another screenshot.")
+        return AWAITING_IMAGE
+    context.user_data["screenshot_bytes"] = screenshot_bytes
+    context.user_data["screenshot"] = screenshot
+    recorder = make_recorder(DEBUG_ARTIFACTS, directory="./debug", prefix=f"{photo_file.file_id}_")
+    context.user_data["artifacts"] = recorder
 
     await update.message.reply_text("Processing image... 🧐")
 
-    matrix = extract_crossword_grid(screenshot_path)
+    # Grid and wheel boxes are found once and shared by both extractors
+    layout = detect_layout(screenshot)
+    context.user_data["layout"] = layout
+    matrix = extract_crossword_grid(screenshot, recorder=recorder, engine=GRID_ENGINE, layout=layout)
     context.user_data["matrix"] = matrix
+    # A new grid needs new sessions
+    context.user_data.pop("solver_session", None)
+    context.user_data.pop("solver_session_plain", None)
     grid_image = matrix_to_crossword_image(matrix)
 
     bio = io.BytesIO()
@@ -157,8 +249,12 @@ async def grid_confirmation_callback(update: Update, context: ContextTypes.DEFAU
         await save_bad_screenshot(context) # Save screenshot if grid is wrong
 
     # This logic is now the same for both "yes" and "no"
-    letters = extract_cyrillic_letters(context.user_data["screenshot_path"])
+    letters = extract_cyrillic_letters(context.user_data["screenshot"], recorder=context.user_data["artifacts"],
+                                       layout=context.user_data["layout"])
     context.user_data["letters"] = letters
+    # The decoded image isn't needed any more; save_bad_screenshot only needs the bytes
+    context.user_data.pop("screenshot", None)
+    context.user_data.pop("layout", None)
 
     keyboard = [
         [
@@ -199,17 +295,14 @@ async def letters_confirmation_callback(update: Update, context: ContextTypes.DE
         words = get_words_data(letters)
 
         if is_grid_correct:
-            matrix = context.user_data["matrix"]
-            solution = solve_crossword_all(matrix, words)
-            
-            if solution:  # If solution was found
-                final_text = format_solution_output(solution, weights=weights_from_words(words))
+            slot_words, complete = solve_grid_words(context, words)
+
+            if slot_words is not None:  # If solution was found
+                final_text = format_feasible_output(slot_words, weights=weights_from_words(words))
+                if not complete:
+                    final_text += PARTIAL_NOTE
                 
-                # Add button to show words as fallback
-                keyboard = [
-                    [InlineKeyboardButton("🔤 Show possible words instead", callback_data="show_words_fallback")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = solution_keyboard()
                 
                 await context.bot.edit_message_caption(
                     chat_id=chat_id,
@@ -220,7 +313,8 @@ async def letters_confirmation_callback(update: Update, context: ContextTypes.DE
                 )
                 # Store words data for potential fallback
                 context.user_data["words_data"] = words
-                return ConversationHandler.END
+                release_screenshot(context)
+                return SOLVED
             else:  # Fallback: couldn't find solution, show words instead
                 final_text = format_words_output(words)
                 final_text = "❌ Couldn't find a complete solution for the grid. Here are possible words:\n\n" + final_text
@@ -233,7 +327,7 @@ async def letters_confirmation_callback(update: Update, context: ContextTypes.DE
             caption=final_text,
             parse_mode="Markdown",
         )
-        cleanup_temp_file(context)
+        release_screenshot(context)
         return ConversationHandler.END
 
     elif query.data == "letters_no":
@@ -258,17 +352,14 @@ async def receive_corrected_letters(update: Update, context: ContextTypes.DEFAUL
     words = get_words_data(corrected_letters)
     
     if is_grid_correct:
-        matrix = context.user_data["matrix"]
-        solution = solve_crossword_all(matrix, words)
-        
-        if solution:  # If solution was found
-            final_text = format_solution_output(solution, weights=weights_from_words(words), custom_letters=True)
+        slot_words, complete = solve_grid_words(context, words)
+
+        if slot_words is not None:  # If solution was found
+            final_text = format_feasible_output(slot_words, weights=weights_from_words(words), custom_letters=True)
+            if not complete:
+                final_text += PARTIAL_NOTE
             
-            # Add button to show words as fallback
-            keyboard = [
-                [InlineKeyboardButton("🔤 Show possible words instead", callback_data="show_words_fallback")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = solution_keyboard()
             
             await context.bot.edit_message_caption(
                 chat_id=chat_id,
@@ -279,7 +370,8 @@ async def receive_corrected_letters(update: Update, context: ContextTypes.DEFAUL
             )
             # Store words data for potential fallback
             context.user_data["words_data"] = words
-            return ConversationHandler.END
+            release_screenshot(context)
+            return SOLVED
         else:  # Fallback: couldn't find solution, show words instead
             final_text = format_words_output(words)
             final_text = "❌ Couldn't find a complete solution for the grid. Here are possible words:\n\n" + final_text
@@ -292,10 +384,22 @@ async def receive_corrected_letters(update: Update, context: ContextTypes.DEFAUL
         caption=final_text,
         parse_mode="Markdown",
     )
-    cleanup_temp_file(context)
+    release_screenshot(context)
     return ConversationHandler.END
 
 
+async def fix_letters_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Asks for corrected letters after a solution; the grid's solver session is reused for them."""
+    query = update.callback_query
+    await query.answer()
+    await context.bot.edit_message_caption(
+        chat_id=query.message.chat_id,
+        message_id=context.user_data["message_id"],
+        caption="Please send me the correct letters as a single text message (e.g., `АБВГДЕЖЗ`).",
+    )
+    return AWAITING_CORRECTED_LETTERS
+
+
 async def fallback_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handles the fallback request to show words instead of solution."""
     query = update.callback_query
@@ -313,16 +417,17 @@ async def fallback_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 caption=final_text,
                 parse_mode="Markdown",
             )
-        cleanup_temp_file(context)
+        release_screenshot(context)
     
     return ConversationHandler.END
 
 async def cleanup_conversation(context: ContextTypes.DEFAULT_TYPE):
     """Clean up any ongoing conversation."""
-    cleanup_temp_file(context)
+    release_screenshot(context)
     # Clear conversation data
-    keys_to_remove = ['user', 'screenshot_path', 'matrix', 'message_id', 'letters', 
-                     'is_crossword_extracted_correct', 'words_data']
+    keys_to_remove = ['user', 'matrix', 'message_id', 'letters', 
+                     'is_crossword_extracted_correct', 'words_data', 'solver_session',
+                     'solver_session_plain']
     for key in keys_to_remove:
         if key in context.user_data:
             del context.user_data[key]
@@ -346,6 +451,9 @@ def main() -> None:
     
     application = Application.builder().token(token).build()
 
+    # Start the OCR workers now rather than on the first screenshot
+    get_ocr_pool()
+
     # Handler for new images that can interrupt any conversation
     new_image_handler_obj = MessageHandler(filters.PHOTO & ~filters.COMMAND, new_image_handler)
 
@@ -368,6 +476,10 @@ def main() -> None:
                 MessageHandler(filters.TEXT & ~filters.COMMAND, receive_corrected_letters),
                 new_image_handler_obj
             ],
+            SOLVED: [
+                CallbackQueryHandler(fix_letters_callback, pattern="^fix_letters$"),
+                new_image_handler_obj
+            ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
     )
@@ -1,10 +1,15 @@
 import argparse
-from functools import lru_cache
+from collections import OrderedDict
+from functools import cached_property, lru_cache
 import hashlib
+import mmap
 import os
-import pickle
+import struct
 import sys
-from collections import defaultdict
+import threading
+import time
+
+import numpy as np
 
 # --------------------------------------------------------------------
 # 1. Русский алфавит и вспомогательные функции
@@ -32,36 +37,106 @@ def counts_leq(a: list[int], b: list[int]) -> bool:
     return True
 
 # --------------------------------------------------------------------
-# 2. Кэширование индекса словаря
+# 2. Индекс словаря
 # --------------------------------------------------------------------
-def _cache_file_path(dict_path: str) -> str:
-    """Путь к файлу‑кешу для данного словаря."""
-    size_bits = os.path.getsize(dict_path) * 8
-    key = f"{dict_path}_{size_bits}"
-    h = hashlib.sha256(key.encode()).hexdigest()
-    cache_dir = os.path.join(os.path.curdir, ".wheel_solver_cache")
-    os.makedirs(cache_dir, exist_ok=True)
-    return os.path.join(cache_dir, f"{h}.pkl")
+# Версия формата индекса – входит в ключ кэша, чтобы старые кэши не подхватывались.
+INDEX_VERSION = 4
+# Больше восьми словарей в один индекс не сливаем: флаги уровней хранятся в uint8.
+MAX_TIERS = 8
 
 
-@lru_cache
-def load_dictionary_cached(path: str) -> dict[int, list[tuple[str, list[int], int]]]:
+class DictionaryIndex:
     """
-    Загружает индекс словаря из кэша (если он существует и актуален),
-    иначе строит его заново и сохраняет в кэш.
+    Индекс словаря. Все слова лежат подряд, упорядоченные по (длина, ранг),
+    поэтому слова одной длины – это непрерывный срез матрицы частот.
+
+    words   – слова (в нижнем регистре) в порядке строк;
+    counts  – uint8-матрица (N, ALPHABET_SIZE) с частотами букв;
+    ranks   – int32-вектор рангов (номер строки в файле словаря);
+    offsets – слова длины L занимают строки [offsets[L], offsets[L + 1]);
+    masks   – uint64-вектор: бит i выставлен, если в слове есть i-я буква;
+    content_hash – sha256 файла словаря, по которому построен индекс.
+
+    Индекс может объединять несколько словарей-уровней (например, «существительные»,
+    «общий», «отфильтрованный»):
+    tier_names – имена уровней;
+    tier_flags – uint8-вектор: бит t выставлен, если слово входит в уровень t;
+    tier_ranks – int32-матрица (N, число уровней): ранг слова в уровне или -1.
+    Для индекса по одному словарю уровень один и совпадает со всем индексом.
     """
-    cache_file = _cache_file_path(path)
 
-    # Попытка загрузить из кеша
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, "rb") as cf:
-                return pickle.load(cf)
-        except Exception:   # если что‑то пошло не так – будем пересчитывать
-            pass
+    def __init__(
+        self,
+        words,
+        counts: np.ndarray,
+        ranks: np.ndarray,
+        offsets: np.ndarray,
+        masks: np.ndarray | None = None,
+        content_hash: str = "",
+        tier_names: tuple[str, ...] = ("main",),
+        tier_flags: np.ndarray | None = None,
+        tier_ranks: np.ndarray | None = None,
+    ):
+        self.words = words
+        self.counts = counts
+        self.ranks = ranks
+        self.offsets = offsets
+        self.masks = counts_to_masks(counts) if masks is None else masks
+        self.content_hash = content_hash
+        self.tier_names = tuple(tier_names)
+        self.tier_flags = np.ones(len(ranks), dtype=np.uint8) if tier_flags is None else tier_flags
+        self.tier_ranks = ranks.reshape(-1, 1) if tier_ranks is None else tier_ranks
+
+    @cached_property
+    def trie(self) -> "LetterTrie":
+        """Префиксное дерево по словам индекса (строится при первом обращении)."""
+        return LetterTrie(self)
+
+    @property
+    def max_length(self) -> int:
+        return len(self.offsets) - 2
+
+    def length_range(self, length: int) -> tuple[int, int]:
+        """Диапазон строк [start, end) для слов заданной длины."""
+        if length < 0 or length > self.max_length:
+            return 0, 0
+        return int(self.offsets[length]), int(self.offsets[length + 1])
+
 
-    # ---- Пересчёт индекса -------------------------------------------------
-    index = defaultdict(list)
+def counts_to_masks(counts: np.ndarray) -> np.ndarray:
+    """Битовые маски наличия букв для строк матрицы частот."""
+    bits = np.left_shift(np.uint64(1), np.arange(ALPHABET_SIZE, dtype=np.uint64))
+    return np.bitwise_or.reduce(np.where(counts > 0, bits, np.uint64(0)), axis=1)
+
+
+def letters_to_counts(letters: str) -> np.ndarray:
+    """Частоты букв набора в виде uint8-вектора (значения ограничены 255)."""
+    counts = np.zeros(ALPHABET_SIZE, dtype=np.int64)
+    for ch in letters.lower():
+        idx = CHAR_TO_IDX.get(ch)
+        if idx is not None:
+            counts[idx] += 1
+    return np.minimum(counts, 255).astype(np.uint8)
+
+
+def match_rows(index: DictionaryIndex, start: int, end: int, input_counts: np.ndarray) -> np.ndarray:
+    """
+    Номера строк индекса из [start, end), которые можно собрать из input_counts.
+    Сначала отсекаем слова с буквами, которых нет в наборе (одно сравнение масок),
+    затем для оставшихся сравниваем частоты с broadcast. Порядок строк сохраняется.
+    """
+    input_mask = counts_to_masks(input_counts[None, :])[0]
+    rows = np.flatnonzero((index.masks[start:end] & ~input_mask) == 0) + start
+    ok = (index.counts[rows] <= input_counts).all(axis=1)
+    return rows[ok]
+
+
+def _read_dictionary(path: str):
+    """
+    Читает файл словаря (одно слово на строку, порядок = ранг).
+    Возвращает кортежи (ранг, слово в нижнем регистре, длина, частоты букв).
+    """
+    entries = []
     try:
         with open(path, encoding="utf-8") as f:
             for rank, line in enumerate(f):
@@ -71,7 +146,6 @@ def load_dictionary_cached(path: str) -> dict[int, list[tuple[str, list[int], in
                 filtered = [ch.lower() for ch in word if ch.isalpha()]
                 if not filtered:
                     continue
-                length = len(filtered)
                 counts = [0] * ALPHABET_SIZE
                 for ch in filtered:
                     idx = CHAR_TO_IDX.get(ch)
@@ -79,70 +153,717 @@ def load_dictionary_cached(path: str) -> dict[int, list[tuple[str, list[int], in
                         break
                     counts[idx] += 1
                 else:
-                    index[length].append((word.lower(), counts, rank))
+                    entries.append((rank, word.lower(), len(filtered), counts))
     except OSError as e:
         print(f"Ошибка чтения словаря '{path}': {e}", file=sys.stderr)
         sys.exit(1)
+    return entries
+
+
+def _length_offsets(lengths: list[int]) -> np.ndarray:
+    """Границы длин для отсортированного по длине списка слов."""
+    max_len = lengths[-1] if lengths else 0
+    return np.searchsorted(
+        np.array(lengths, dtype=np.int64), np.arange(max_len + 2), side="left"
+    ).astype(np.int64)
+
+
+def build_index(path: str) -> DictionaryIndex:
+    """Строит индекс по файлу словаря (одно слово на строку, порядок = ранг)."""
+    entries = _read_dictionary(path)
+    entries.sort(key=lambda e: (e[2], e[0]))
+
+    words = [e[1] for e in entries]
+    counts = np.array([e[3] for e in entries], dtype=np.uint8).reshape(-1, ALPHABET_SIZE)
+    ranks = np.array([e[0] for e in entries], dtype=np.int32)
+    offsets = _length_offsets([e[2] for e in entries])
+    name = os.path.splitext(os.path.basename(path))[0]
+    return DictionaryIndex(
+        words,
+        np.ascontiguousarray(counts),
+        ranks,
+        offsets,
+        content_hash=dictionary_hash(path),
+        tier_names=(name,),
+    )
+
+
+def tiers_hash(tiers: tuple[tuple[str, str], ...]) -> str:
+    """sha256 объединённого индекса: имена уровней и хеши их словарей."""
+    key = ";".join(f"{name}:{dictionary_hash(path)}" for name, path in tiers)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def build_tiered_index(tiers: tuple[tuple[str, str], ...]) -> DictionaryIndex:
+    """
+    Строит один индекс по нескольким словарям-уровням ((имя, путь), ...).
+    Каждое слово хранится один раз с флагами уровней и рангом в каждом из них.
+    Строки упорядочены по (длина, первый уровень со словом, ранг в нём),
+    так что обычный поиск по такому индексу отдаёт слова «по уровням».
+    """
+    if not 0 < len(tiers) <= MAX_TIERS:
+        raise ValueError(f"Число уровней должно быть от 1 до {MAX_TIERS}, получено {len(tiers)}")
+
+    merged = {}   # слово -> [длина, частоты, первый уровень, ранг в нём, ранги по уровням]
+    for t, (_, path) in enumerate(tiers):
+        for rank, word, length, counts in _read_dictionary(path):
+            entry = merged.get(word)
+            if entry is None:
+                entry = merged[word] = [length, counts, t, rank, [-1] * len(tiers)]
+            if entry[4][t] < 0:
+                entry[4][t] = rank
+
+    items = sorted(merged.items(), key=lambda kv: (kv[1][0], kv[1][2], kv[1][3]))
+    words = [word for word, _ in items]
+    entries = [entry for _, entry in items]
+    counts = np.array([e[1] for e in entries], dtype=np.uint8).reshape(-1, ALPHABET_SIZE)
+    ranks = np.array([e[3] for e in entries], dtype=np.int32)
+    tier_ranks = np.array([e[4] for e in entries], dtype=np.int32).reshape(-1, len(tiers))
+    tier_flags = np.zeros(len(entries), dtype=np.uint8)
+    for t in range(len(tiers)):
+        tier_flags |= (tier_ranks[:, t] >= 0).astype(np.uint8) << t
+
+    return DictionaryIndex(
+        words,
+        np.ascontiguousarray(counts),
+        ranks,
+        _length_offsets([e[0] for e in entries]),
+        content_hash=tiers_hash(tiers),
+        tier_names=tuple(name for name, _ in tiers),
+        tier_flags=tier_flags,
+        tier_ranks=np.ascontiguousarray(tier_ranks),
+    )
+
+
+# --------------------------------------------------------------------
+# 3. Бинарный файл индекса (mmap) и кэширование
+# --------------------------------------------------------------------
+# Формат (little-endian), все секции выровнены на 8 байт:
+#   заголовок  – magic, версия, sha256 словаря, N, ALPHABET_SIZE, max_len, размер строк,
+#                число уровней T, размер имён уровней;
+#   offsets    – int64[max_len + 2]  границы длин;
+#   ranks      – int32[N]            ранги;
+#   str_offs   – int64[N + 1]        границы слов в таблице строк;
+#   masks      – uint64[N]           маски наличия букв;
+#   counts     – uint8[N, ALPHABET_SIZE];
+#   tier_flags – uint8[N]            флаги уровней;
+#   tier_ranks – int32[N, T]         ранги по уровням;
+#   strings    – UTF-8 слова подряд;
+#   tier_names – UTF-8 имена уровней через "\n".
+# Файл открывается через mmap только на чтение, поэтому массивы – это
+# представления без копирования, а страницы делятся между процессами бота.
+INDEX_MAGIC = b"WSIX"
+_HEADER = struct.Struct("<4sI32sIIIQII")
+CACHE_DIR = os.path.join(os.path.curdir, ".wheel_solver_cache")
+
+
+def dictionary_hash(path: str) -> str:
+    """sha256 содержимого файла словаря."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class StringTable:
+    """Таблица строк поверх буфера: слово декодируется только при обращении."""
+
+    def __init__(self, buf, offsets: np.ndarray):
+        self._buf = buf
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
 
-    # Сохраняем в кэш
+    def __getitem__(self, i) -> str:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return str(self._buf[start:end], "utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def write_index(index: DictionaryIndex, out_path: str) -> None:
+    """Сохраняет индекс в бинарный файл (атомарно: через временный файл и rename)."""
+    blobs = [w.encode("utf-8") for w in index.words]
+    str_offs = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=str_offs[1:])
+    strings = b"".join(blobs)
+    tier_names = "\n".join(index.tier_names).encode("utf-8")
+
+    header = _HEADER.pack(
+        INDEX_MAGIC,
+        INDEX_VERSION,
+        bytes.fromhex(index.content_hash),
+        len(index.words),
+        ALPHABET_SIZE,
+        index.max_length,
+        len(strings),
+        len(index.tier_names),
+        len(tier_names),
+    )
+    sections = [
+        np.ascontiguousarray(index.offsets, dtype="<i8").tobytes(),
+        np.ascontiguousarray(index.ranks, dtype="<i4").tobytes(),
+        str_offs.astype("<i8").tobytes(),
+        np.ascontiguousarray(index.masks, dtype="<u8").tobytes(),
+        np.ascontiguousarray(index.counts, dtype=np.uint8).tobytes(),
+        np.ascontiguousarray(index.tier_flags, dtype=np.uint8).tobytes(),
+        np.ascontiguousarray(index.tier_ranks, dtype="<i4").tobytes(),
+        strings,
+        tier_names,
+    ]
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for data in sections:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, out_path)
+
+
+def open_index(path: str, expected_hash: str | None = None) -> DictionaryIndex:
+    """
+    Открывает бинарный индекс через mmap без копирования данных.
+    Бросает ValueError, если файл повреждён, другой версии или
+    построен не по словарю с хешем expected_hash.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mm) < _HEADER.size:
+        raise ValueError(f"{path}: файл индекса обрезан")
+    (magic, version, digest, n, alphabet_size, max_len, strings_size,
+     n_tiers, names_size) = _HEADER.unpack_from(mm, 0)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION or alphabet_size != ALPHABET_SIZE:
+        raise ValueError(f"{path}: неподдерживаемый формат индекса")
+    content_hash = digest.hex()
+    if expected_hash is not None and content_hash != expected_hash:
+        raise ValueError(f"{path}: индекс построен по другому словарю")
+
+    pos = _HEADER.size
+
+    def section(dtype, count):
+        nonlocal pos
+        pos = _align(pos)
+        arr = np.frombuffer(mm, dtype=dtype, count=count, offset=pos)
+        pos += arr.nbytes
+        return arr
+
+    offsets = section("<i8", max_len + 2)
+    ranks = section("<i4", n)
+    str_offs = section("<i8", n + 1)
+    masks = section("<u8", n)
+    counts = section(np.uint8, n * ALPHABET_SIZE).reshape(n, ALPHABET_SIZE)
+    tier_flags = section(np.uint8, n)
+    tier_ranks = section("<i4", n * n_tiers).reshape(n, n_tiers)
+    pos = _align(pos)
+    names_pos = _align(pos + strings_size)
+    if names_pos + names_size > len(mm) or str_offs[-1] != strings_size:
+        raise ValueError(f"{path}: файл индекса обрезан")
+    strings = memoryview(mm)[pos:pos + strings_size]
+    tier_names = str(mm[names_pos:names_pos + names_size], "utf-8").split("\n")
+
+    return DictionaryIndex(
+        StringTable(strings, str_offs), counts, ranks, offsets, masks, content_hash,
+        tier_names, tier_flags, tier_ranks,
+    )
+
+
+def _cache_file_path(content_hash: str) -> str:
+    """Путь к файлу индекса в кэше: ключ – хеш содержимого словаря."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, f"{content_hash}.v{INDEX_VERSION}.idx")
+
+
+def _load_or_build(content_hash: str, build) -> DictionaryIndex:
+    """Открывает индекс из кэша по хешу или строит его через build() и сохраняет."""
+    cache_file = _cache_file_path(content_hash)
+
+    # Попытка открыть готовый индекс
+    if os.path.exists(cache_file):
+        try:
+            return open_index(cache_file, content_hash)
+        except (OSError, ValueError):   # если что‑то пошло не так – будем пересчитывать
+            pass
+
+    index = build()
+
+    # Сохраняем в кэш и открываем через mmap, чтобы страницы делились между процессами
     try:
-        with open(cache_file, "wb") as cf:
-            pickle.dump(dict(index), cf)  # сохраняем как обычный dict
-    except Exception:   # не критично – просто продолжаем без кеша
-        pass
+        write_index(index, cache_file)
+        return open_index(cache_file, content_hash)
+    except (OSError, ValueError):   # не критично – просто продолжаем без кеша
+        return index
 
-    return dict(index)
+
+@lru_cache
+def load_dictionary_cached(path: str) -> DictionaryIndex:
+    """
+    Загружает индекс словаря из кэша (если он существует и актуален),
+    иначе строит его заново и сохраняет в кэш.
+    """
+    return _load_or_build(dictionary_hash(path), lambda: build_index(path))
+
+
+@lru_cache
+def load_tiered_index_cached(tiers: tuple[tuple[str, str], ...]) -> DictionaryIndex:
+    """То же для объединённого индекса по словарям-уровням ((имя, путь), ...)."""
+    return _load_or_build(tiers_hash(tiers), lambda: build_tiered_index(tiers))
 
 # --------------------------------------------------------------------
-# 3. Поиск подходящих слов
+# 4. Поиск подходящих слов
 # --------------------------------------------------------------------
 def find_words(
-    index: dict[int, list[tuple[str, list[int], int]]],
+    index: DictionaryIndex,
     letters: str,
     length: int,
 ) -> list[tuple[str, int]]:
     """Возвращает список всех слов нужной длины, которые можно собрать из букв."""
-    input_counts = [0] * ALPHABET_SIZE
-    for ch in letters.lower():
-        idx = CHAR_TO_IDX.get(ch)
-        if idx is not None:
-            input_counts[idx] += 1
+    input_counts = letters_to_counts(letters)
+    start, end = index.length_range(length)
+    rows = match_rows(index, start, end, input_counts)
+
+    # Строки уже в порядке популярности (как они встречаются в словаре)
+    return [(index.words[i], int(index.ranks[i])) for i in rows]
+
+
+class LetterTrie:
+    """
+    Префиксное дерево по буквам слов индекса. children[node] – {буква: узел},
+    terminals[node] – номера строк индекса, слова которых заканчиваются в node.
+    """
+
+    def __init__(self, index: DictionaryIndex):
+        self.children: list[dict[int, int]] = [{}]
+        self.terminals: dict[int, list[int]] = {}
+        for row, word in enumerate(index.words):
+            node = 0
+            for ch in word:
+                idx = CHAR_TO_IDX.get(ch)
+                if idx is None:              # дефисы и т.п. в длину слова не входят
+                    continue
+                nxt = self.children[node].get(idx)
+                if nxt is None:
+                    nxt = len(self.children)
+                    self.children[node][idx] = nxt
+                    self.children.append({})
+                node = nxt
+            self.terminals.setdefault(node, []).append(row)
+
+    def match_rows(self, input_counts: np.ndarray) -> np.ndarray:
+        """
+        Номера строк всех слов, которые можно собрать из input_counts.
+        Обход в глубину расходует буквы набора и не заходит в ветки,
+        для которых буква уже закончилась, поэтому стоимость зависит
+        от числа ответов, а не от размера словаря.
+        """
+        avail = input_counts.tolist()
+        present = [i for i, c in enumerate(avail) if c]
+        children, terminals = self.children, self.terminals
+        found = []
+
+        def walk(node):
+            rows = terminals.get(node)
+            if rows:
+                found.extend(rows)
+            node_children = children[node]
+            for letter in present:
+                if avail[letter]:
+                    child = node_children.get(letter)
+                    if child is not None:
+                        avail[letter] -= 1
+                        walk(child)
+                        avail[letter] += 1
+
+        walk(0)
+        found.sort()
+        return np.array(found, dtype=np.int64)
+
 
-    candidates = index.get(length, [])
-    result = []
+ENGINES = ("linear", "trie")
 
-    for word, w_counts, rank in candidates:
-        if counts_leq(w_counts, input_counts):
-            result.append((word, rank))
 
-    # Слова уже в порядке популярности (как они встречаются в словаре)
+def find_words_all(
+    index: DictionaryIndex,
+    letters: str,
+    top_n: int | None = None,
+    engine: str = "linear",
+) -> dict[int, list[str]]:
+    """
+    Все слова, которые можно собрать из букв, сгруппированные по длине:
+    {длина: [слова по рангу]}. Частоты букв считаются один раз, а индекс
+    просматривается одним проходом по всем длинам до len(letters).
+    top_n – если задано, не больше top_n слов каждой длины.
+    engine – "linear" (сравнение матрицы частот) или "trie" (обход префиксного
+    дерева); результаты одинаковы.
+    """
+    rows, max_len = _match_letters(index, letters, engine)
+    return group_rows(index, rows, max_len, top_n)
+
+
+def _match_letters(index: DictionaryIndex, letters: str, engine: str) -> tuple[np.ndarray, int]:
+    """Отсортированные номера строк слов из букв и максимальная длина слова."""
+    input_counts = letters_to_counts(letters)
+    max_len = min(len(letters), index.max_length)
+    if engine == "linear":
+        end = int(index.offsets[max_len + 1])
+        rows = match_rows(index, 0, end, input_counts)
+    elif engine == "trie":
+        rows = index.trie.match_rows(input_counts)
+    else:
+        raise ValueError(f"Неизвестный движок поиска: {engine!r}, ожидается один из {ENGINES}")
+    return rows, max_len
+
+
+def group_rows(
+    index: DictionaryIndex,
+    rows: np.ndarray,
+    max_len: int,
+    top_n: int | None = None,
+) -> dict[int, list[str]]:
+    """Раскладывает отсортированные номера строк в {длина: [слова по рангу]}."""
+    # Строки упорядочены по (длина, ранг) – границы длин находим бинарным поиском
+    bounds = np.searchsorted(rows, index.offsets[:max_len + 2])
+    d = {}
+    for L in range(max_len + 1):
+        lo, hi = int(bounds[L]), int(bounds[L + 1])
+        if top_n is not None:
+            hi = min(hi, lo + top_n)
+        if lo < hi:
+            d[L] = [index.words[i] for i in rows[lo:hi]]
+    return d
+
+
+def find_words_tiered(
+    index: DictionaryIndex,
+    letters: str,
+    top_n: int | None = None,
+    engine: str = "linear",
+) -> dict[str, dict[int, list[str]]]:
+    """
+    Поиск по объединённому индексу: один проход по всем словам, затем
+    раскладка по уровням – {имя уровня: {длина: [слова по рангу в уровне]}}.
+    Уровни идут в порядке индекса (например, сначала существительные).
+    """
+    rows, _ = _match_letters(index, letters, engine)
+    lengths = np.searchsorted(index.offsets, rows, side="right") - 1
+    flags = index.tier_flags[rows]
+
+    result = {}
+    for t, name in enumerate(index.tier_names):
+        sel = np.flatnonzero(flags & (1 << t))
+        order = np.lexsort((index.tier_ranks[rows[sel], t], lengths[sel]))
+        d = {}
+        for i in sel[order]:
+            words = d.setdefault(int(lengths[i]), [])
+            if top_n is None or len(words) < top_n:
+                words.append(index.words[rows[i]])
+        result[name] = {L: words for L, words in d.items() if words}
     return result
 
+
 def find_words_by_indx(indx, letters):
-    d = {}
-    for L in range(len(letters)+1):
-        matches = find_words(indx, letters, L)
-        if matches:
-            d[L] = [w[0] for w in sorted(matches, key=lambda x: x[1])]
-    return d    
+    return find_words_all(indx, letters)
+
+
+# --------------------------------------------------------------------
+# 5. Таблица готовых ответов для колёс
+# --------------------------------------------------------------------
+# Колесо почти всегда совпадает с набором букв какого-то длинного слова
+# словаря, поэтому ответы для всех таких наборов можно посчитать заранее.
+# Ключ – отсортированные буквы набора, значение – номера строк индекса.
+# Формат (little-endian), секции выровнены на 8 байт:
+#   заголовок  – magic, версия, sha256 словаря индекса, число ключей, размер ключей,
+#                число строк, размер номера строки (2 или 4 байта);
+#   key_offs   – int64[K + 1]  границы ключей в таблице строк;
+#   row_offs   – int64[K + 1]  границы ответов в массиве строк;
+#   rows       – uint16/uint32[R]  номера строк индекса (по возрастанию внутри ключа);
+#   keys       – UTF-8 ключи подряд (отсортированы).
+WHEEL_MAGIC = b"WSWT"
+WHEEL_TABLE_VERSION = 1
+WHEEL_MIN_LETTERS = 5
+WHEEL_SOURCES = ("russian_words50.txt", "rus50_filter.txt", "nouns.txt")
+_WHEEL_HEADER = struct.Struct("<4sI32sIQQI")
+
+
+def normalize_letters(letters: str) -> str:
+    """Набор букв в каноническом виде: буквы алфавита в нижнем регистре, по порядку."""
+    return "".join(sorted(ch for ch in letters.lower() if ch in CHAR_TO_IDX))
+
+
+class WheelTable:
+    """Открытая через mmap таблица ответов; поиск по ключу – обращение к dict."""
+
+    def __init__(self, keys: StringTable, row_offs: np.ndarray, rows: np.ndarray, index_hash: str):
+        self.row_offs = row_offs
+        self.rows = rows
+        self.index_hash = index_hash
+        self._slots = {key: i for i, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def lookup(self, key: str) -> np.ndarray | None:
+        """Номера строк ответа для нормализованного набора букв или None."""
+        i = self._slots.get(key)
+        if i is None:
+            return None
+        return self.rows[self.row_offs[i]:self.row_offs[i + 1]].astype(np.int64)
+
+
+def wheel_keys(paths) -> list[str]:
+    """Все различные наборы букв слов длиной от WHEEL_MIN_LETTERS из словарей."""
+    keys = set()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                filtered = [ch.lower() for ch in line.strip() if ch.isalpha()]
+                if len(filtered) < WHEEL_MIN_LETTERS:
+                    continue
+                if all(ch in CHAR_TO_IDX for ch in filtered):
+                    keys.add("".join(sorted(filtered)))
+    return sorted(keys)
+
+
+def write_wheel_table(index: DictionaryIndex, keys: list[str], out_path: str) -> None:
+    """Считает ответы для всех ключей по индексу и сохраняет таблицу."""
+    blobs = [key.encode("utf-8") for key in keys]
+    key_offs = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=key_offs[1:])
+
+    answers = []
+    for key in keys:
+        end = int(index.offsets[min(len(key), index.max_length) + 1])
+        answers.append(match_rows(index, 0, end, letters_to_counts(key)).astype(np.uint32))
+    row_offs = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in answers], out=row_offs[1:])
+    rows = np.concatenate(answers) if answers else np.zeros(0, dtype=np.uint32)
+    # Для словарей до 65536 слов номера строк помещаются в два байта
+    row_dtype = "<u2" if len(index.words) <= 1 << 16 else "<u4"
+
+    header = _WHEEL_HEADER.pack(
+        WHEEL_MAGIC,
+        WHEEL_TABLE_VERSION,
+        bytes.fromhex(index.content_hash),
+        len(keys),
+        int(key_offs[-1]),
+        len(rows),
+        np.dtype(row_dtype).itemsize,
+    )
+    sections = [
+        key_offs.astype("<i8").tobytes(),
+        row_offs.astype("<i8").tobytes(),
+        rows.astype(row_dtype).tobytes(),
+        b"".join(blobs),
+    ]
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for data in sections:
+            f.write(b"\0" * (_align(f.tell()) - f.tell()))
+            f.write(data)
+    os.replace(tmp_path, out_path)
+
+
+def open_wheel_table(path: str, index_hash: str) -> WheelTable:
+    """
+    Открывает таблицу ответов через mmap. Бросает ValueError, если файл
+    повреждён, другой версии или посчитан не по индексу с хешем index_hash.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mm) < _WHEEL_HEADER.size:
+        raise ValueError(f"{path}: файл таблицы обрезан")
+    magic, version, digest, n_keys, keys_size, n_rows, row_size = _WHEEL_HEADER.unpack_from(mm, 0)
+    if magic != WHEEL_MAGIC or version != WHEEL_TABLE_VERSION or row_size not in (2, 4):
+        raise ValueError(f"{path}: неподдерживаемый формат таблицы")
+    if digest.hex() != index_hash:
+        raise ValueError(f"{path}: таблица посчитана по другому словарю")
+
+    pos = _WHEEL_HEADER.size
+
+    def section(dtype, count):
+        nonlocal pos
+        pos = _align(pos)
+        arr = np.frombuffer(mm, dtype=dtype, count=count, offset=pos)
+        pos += arr.nbytes
+        return arr
+
+    key_offs = section("<i8", n_keys + 1)
+    row_offs = section("<i8", n_keys + 1)
+    rows = section(f"<u{row_size}", n_rows)
+    pos = _align(pos)
+    if pos + keys_size > len(mm) or key_offs[-1] != keys_size or row_offs[-1] != n_rows:
+        raise ValueError(f"{path}: файл таблицы обрезан")
+    keys = StringTable(memoryview(mm)[pos:pos + keys_size], key_offs)
+    return WheelTable(keys, row_offs, rows, digest.hex())
+
+
+def _wheel_table_path(index_hash: str) -> str:
+    """Путь к таблице ответов в кэше: ключ – хеш словаря индекса."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, f"{index_hash}.v{WHEEL_TABLE_VERSION}.wheels")
+
 
-def get_words_data(letters):
+@lru_cache(maxsize=8)
+def _open_wheel_table_cached(path: str, index_hash: str, mtime_ns: int) -> WheelTable | None:
+    try:
+        return open_wheel_table(path, index_hash)
+    except (OSError, ValueError):
+        return None
+
+
+def load_wheel_table(index_hash: str) -> WheelTable | None:
+    """
+    Таблица ответов для индекса из кэша или None, если её не строили.
+    Открытая таблица кешируется по времени изменения файла, поэтому
+    построенная (или пересобранная) при работающем боте подхватывается сразу.
+    """
+    path = _wheel_table_path(index_hash)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return _open_wheel_table_cached(path, index_hash, mtime_ns)
+
+
+def find_words_precomputed(
+    index: DictionaryIndex,
+    letters: str,
+    top_n: int | None = None,
+) -> dict[int, list[str]] | None:
+    """Ответ из таблицы готовых колёс или None, если этого набора в ней нет."""
+    table = load_wheel_table(index.content_hash)
+    if table is None:
+        return None
+    key = normalize_letters(letters)
+    rows = table.lookup(key)
+    if rows is None:
+        return None
+    return group_rows(index, rows, min(len(key), index.max_length), top_n)
+
+
+# --------------------------------------------------------------------
+# 6. Кэш результатов
+# --------------------------------------------------------------------
+class WordsCache:
+    """
+    LRU-кэш результатов поиска с ограничением размера и временем жизни записей.
+    Ключ – нормализованный набор букв, поэтому «ПРИВЕТ» и «тевирп» – одна запись.
+    Записи привязаны к версии индекса (хешу словаря): при смене версии кэш
+    очищается целиком.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()   # ключ -> (момент истечения, значение)
+        self._version = None
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize: int | None = None, ttl: float | None = None) -> None:
+        """Меняет размер и/или время жизни (в секундах); лишние записи вытесняются."""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl if ttl > 0 else None
+            self._evict()
+
+    def invalidate(self, version=None) -> None:
+        """Очищает кэш и запоминает новую версию индекса."""
+        with self._lock:
+            self._data.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """Значение по ключу или None; записи другой версии индекса не возвращаются."""
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+            item = self._data.get(key)
+            if item is not None and (item[0] is None or item[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value) -> None:
+        with self._lock:
+            if version != self._version or self.maxsize <= 0:
+                return
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            self._evict()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses}
+
+    def _evict(self) -> None:
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+
+
+words_cache = WordsCache(
+    maxsize=int(os.getenv("WORDS_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("WORDS_CACHE_TTL", "3600")) or None,
+)
+
+
+DICTIONARY_TIERS = (
+    ("nouns", "nouns.txt"),
+    ("general", "russian_words50.txt"),
+    ("filtered", "rus50_filter.txt"),
+)
+
+
+def get_tiered_words_data(letters, top_n=None, engine="linear"):
+    index = load_tiered_index_cached(DICTIONARY_TIERS)
+    return find_words_tiered(index, letters, top_n, engine)
+
+
+def get_words_data(letters, top_n=None, engine="linear"):
     # index = load_dictionary_cached("nouns.txt")
-    # d = find_words_by_indx(index, letters)
+    # d = find_words_all(index, letters, top_n, engine)
     # if d:
     #     return d
     index = load_dictionary_cached("russian_words50.txt")
-    d = find_words_by_indx(index, letters)
-    return d
+    key = (normalize_letters(letters), top_n)
+    d = words_cache.get(key, index.content_hash)
+    if d is None:
+        d = find_words_precomputed(index, letters, top_n)
+        if d is None:
+            d = find_words_all(index, letters, top_n, engine)
+        words_cache.put(key, index.content_hash, d)
+    # Отдаём копию, чтобы вызывающий код не испортил запись в кэше
+    return {L: list(words) for L, words in d.items()}
 
 # --------------------------------------------------------------------
-# 4. CLI
+# 7. CLI
 # --------------------------------------------------------------------
 def main():
     parser = argparse.ArgumentParser(
         description="Solver для игры «колесо букв» с кэшированием словаря"
     )
-    parser.add_argument("-l", "--letters", required=True,
+    parser.add_argument("-l", "--letters",
                         help="Набор доступных букв (строка)")
     # Принимаем несколько длин; если не указано – используем все длины
     parser.add_argument(
@@ -161,8 +882,73 @@ def main():
         default="/usr/share/dict/words",
         help="Путь к файлу со списком слов (по умолчанию /usr/share/dict/words)",
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        choices=ENGINES,
+        default="linear",
+        help="Движок поиска: линейный по матрице частот или префиксное дерево",
+    )
+    parser.add_argument(
+        "--build-index",
+        nargs="?",
+        const="",
+        metavar="OUT",
+        help=(
+            "Построить бинарный индекс словаря и выйти. Без OUT индекс "
+            f"сохраняется в кэш ({CACHE_DIR})"
+        ),
+    )
+    parser.add_argument(
+        "--tiers",
+        nargs="+",
+        metavar="NAME=PATH",
+        help=(
+            "Словари-уровни для объединённого индекса. С --build-index строит "
+            "его вместо индекса по --dict, с --letters выводит слова по уровням"
+        ),
+    )
+    parser.add_argument(
+        "--build-wheels",
+        nargs="?",
+        const="",
+        metavar="OUT",
+        help=(
+            "Посчитать таблицу ответов для наборов букв всех слов из "
+            "--wheel-sources по словарю --dict и выйти. Без OUT таблица "
+            f"сохраняется в кэш ({CACHE_DIR})"
+        ),
+    )
+    parser.add_argument(
+        "--wheel-sources",
+        nargs="+",
+        default=list(WHEEL_SOURCES),
+        help="Словари, из слов которых берутся наборы букв для --build-wheels",
+    )
     args = parser.parse_args()
 
+    if args.build_wheels is not None:
+        index = load_dictionary_cached(args.dict)
+        keys = wheel_keys(args.wheel_sources)
+        out = args.build_wheels or _wheel_table_path(index.content_hash)
+        write_wheel_table(index, keys, out)
+        print(f"Таблица колёс: {out} ({len(keys)} наборов)")
+        return
+    tiers = None
+    if args.tiers:
+        tiers = tuple(tuple(spec.split("=", 1)) for spec in args.tiers)
+        if any(len(t) != 2 for t in tiers):
+            parser.error("--tiers ожидает значения вида NAME=PATH")
+
+    if args.build_index is not None:
+        index = build_tiered_index(tiers) if tiers else build_index(args.dict)
+        out = args.build_index or _cache_file_path(index.content_hash)
+        write_index(index, out)
+        print(f"Индекс: {out} ({len(index.words)} слов, sha256 {index.content_hash})")
+        return
+    if not args.letters:
+        parser.error("нужен --letters (или --build-index / --build-wheels)")
+
     # Определяем длины, которые нужно проверить
     if args.lengths:
         lengths = sorted(set(args.lengths))
@@ -170,14 +956,24 @@ def main():
         max_len_from_letters = len(args.letters)
         lengths = list(range(1, max_len_from_letters + 1))
 
+    if tiers:
+        index = load_tiered_index_cached(tiers)
+        for name, found in find_words_tiered(index, args.letters, engine=args.engine).items():
+            print(f"\n=== {name} ===")
+            for L in lengths:
+                if found.get(L):
+                    print(f"{L}: {', '.join(found[L])}")
+        return
+
     index = load_dictionary_cached(args.dict)
 
+    found = find_words_all(index, args.letters, engine=args.engine)
+
     for L in lengths:
-        matches = find_words(index, args.letters, L)
+        matches = found.get(L)
         if matches:
             print(f"\nДлина {L} ({len(matches)} слов):")
-            a = sorted(matches, key=lambda x: x[1])
-            for w, r in a:
+            for w in matches:
                 print(w)
         else:
             print(f"\nДлина {L}: Совпадений не найдено.")